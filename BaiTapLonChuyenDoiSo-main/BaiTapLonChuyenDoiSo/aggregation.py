@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+
+# Score buckets are right-inclusive: (lo, hi]; the first bucket also takes
+# everything <= its upper edge and the last one everything above its lower edge
+DEFAULT_SCORE_EDGES = (0, 2, 4, 6, 8, 10)
+
+
+def score_bucket_labels(edges):
+    """'0-2', '2-4', ... for the given bucket edges"""
+    return [f'{lo:g}-{hi:g}' for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def score_distribution(scores, edges=DEFAULT_SCORE_EDGES):
+    """Count scores per bucket with np.digitize + np.bincount"""
+    edges = [float(e) for e in edges]
+    if len(edges) < 2 or any(b <= a for a, b in zip(edges[:-1], edges[1:])):
+        raise ValueError('score_edges phải là dãy tăng dần có ít nhất 2 phần tử')
+    n_buckets = len(edges) - 1
+    buckets = np.digitize(scores, edges[1:-1], right=True)
+    counts = np.bincount(buckets, minlength=n_buckets)
+    return dict(zip(score_bucket_labels(edges), counts.tolist()))
+
+
+def value_counts(values):
+    """{value: count}, using bincount for small non-negative integers"""
+    values = np.asarray(values)
+    if values.size == 0:
+        return {}
+    if np.issubdtype(values.dtype, np.integer) and values.min() >= 0 and values.max() < 1 << 20:
+        counts = np.bincount(values)
+        present = np.flatnonzero(counts)
+        return dict(zip(present.tolist(), counts[present].tolist()))
+    uniques, counts = np.unique(values, return_counts=True)
+    return dict(zip(uniques.tolist(), counts.tolist()))
+
+
+def class_dropout(classes, is_dropout):
+    """Per-class totals and dropout rates, classes in order of first appearance"""
+    codes, uniques = pd.Series(classes).factorize(use_na_sentinel=False)
+    totals = np.bincount(codes, minlength=len(uniques))
+    dropouts = np.bincount(codes, weights=is_dropout, minlength=len(uniques)).astype(np.int64)
+    rates = np.round(dropouts / np.maximum(totals, 1) * 100, 2)
+    return [
+        {
+            'class': lop,
+            'total_students': total,
+            'dropout_count': dropout,
+            'dropout_rate': rate
+        }
+        for lop, total, dropout, rate in zip(uniques.tolist(), totals.tolist(), dropouts.tolist(), rates.tolist())
+    ]
+
+
+def chart_series(results, score_edges=DEFAULT_SCORE_EDGES):
+    """Compute every /chart_data series from a results DataFrame in one go"""
+    n = len(results)
+
+    def column(name, default):
+        if name not in results:
+            return pd.Series(np.full(n, default))
+        values = results[name]
+        return values.fillna(default) if values.hasnans else values
+
+    is_dropout = column('prediction', 0).to_numpy() == 1
+    dropout_count = int(is_dropout.sum())
+    dropout_rate = (dropout_count / n * 100) if n > 0 else 0
+
+    return {
+        'class_data': class_dropout(column('lop', 'Unknown'), is_dropout),
+        'overall_stats': {
+            'total_students': n,
+            'dropout_count': dropout_count,
+            'dropout_rate': round(dropout_rate, 2)
+        },
+        'score_distribution': score_distribution(column('DiemTB', 0).to_numpy(dtype=np.float64), score_edges),
+        'failed_credits_distribution': value_counts(column('tin_chi_rot', 0).to_numpy())
+    }
@@ -1,80 +1,100 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 import os
+import hmac
+import json
+import threading
+import uuid
+from functools import partial
+import click
+import aggregation
+from batching import MicroBatcher
+from cohort_store import CohortStore
+import exporting
+import ingestion
+import jobs
+import metrics
+import model_cache
+from prediction_cache import PredictionCache
+from result_cache import ResultCache
+import schema
+from student_store import StudentStore
+import training
+from training_store import TrainingStore, prepare_batch
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 
 # Global variables
-model = None
-scaler = None
+# Compiled forest (scaler folded in); serving does not need scikit-learn.
+# Retraining replaces it with one assignment; forest.version is its artifact key.
+forest = None
+training_store = TrainingStore()
+retrain_lock = threading.Lock()
+# /retrain replaces the served model, so it is off unless a token is configured
+# (the `flask retrain` command needs none)
+RETRAIN_TOKEN = os.environ.get('RETRAIN_TOKEN') or None
+student_store = StudentStore('dulieu1.xlsx')
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 32)),
+    ttl_seconds=int(os.environ.get('RESULT_CACHE_TTL', 3600)),
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_MB', 256)) * 1024 * 1024
+)
+# Every scored roster is also saved in SQLite for filtered, paginated queries (/api/students)
+cohort_store = CohortStore(
+    os.environ.get('COHORT_DB', 'cohorts.db'),
+    max_cohorts=int(os.environ.get('COHORT_MAX', 20)),
+    write_behind=os.environ.get('COHORT_WRITE_BEHIND', '1') == '1'
+)
+prediction_cache = PredictionCache(max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 100000)))
+# Per-feature risk contributions, memoized the same way as the probabilities
+contribution_cache = PredictionCache(max_entries=int(os.environ.get('CONTRIBUTION_CACHE_SIZE', 100000)))
+# Background batch scoring; JOB_STORE=sqlite:///jobs.db keeps job state in SQLite
+job_queue = jobs.JobQueue(
+    jobs.make_backend(os.environ.get('JOB_STORE', 'memory')),
+    max_jobs=int(os.environ.get('JOB_MAX_CONCURRENT', 2)),
+    max_processes=int(os.environ.get('JOB_PROCESSES', 0)) or None
+)
 
-def load_and_train_model(filename):
-    """Load data and train model with simplified columns"""
-    global model, scaler
+# Hyperparameters; part of the model artifact key so changing them retrains.
+# Every combination in 'search' is cross-validated in a process pool and the
+# best one whose single-row latency fits MODEL_LATENCY_BUDGET_MS is kept.
+MODEL_PARAMS = {
+    'random_state': 42,
+    'test_size': 0.2,
+    'cv_folds': 5,
+    'search': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 6, 12]
+    },
+    'latency_budget_ms': float(os.environ.get('MODEL_LATENCY_BUDGET_MS', 1.0))
+}
+
+def train_model(X, y):
+    """Search MODEL_PARAMS on the training split; returns (model, scaler, report)"""
+    return training.train_and_select(X, y, MODEL_PARAMS)
+
+def load_and_train_model(filename, force=False):
+    """Load data and train model with simplified columns (cached on disk)"""
+    global forest
     
     try:
         # Read Excel file
         df = pd.read_excel(filename)
         
-        # Handle different column names for required columns only
-        column_mapping = {
-            'DiemTB': ['DiemTB', 'diem_tb', 'AverageScore', 'Score', 'Điểm TB', 'Điểm trung bình'],
-            'TinChiRot': ['TinChiRot', 'tin_chi_rot', 'FailedCredits', 'Tín chỉ rớt', 'SoTinChiRot', 'Số tín chỉ rớt'],
-            'SoMonHocLai': ['SoMonHocLai', 'so_mon_hoc_lai', 'FailedSubjects', 'Số môn học lại', 'MonHocLai', 'Số môn rớt'],
-            'BoHoc': ['BoHoc', 'bo_hoc', 'Dropout', 'Bỏ học'],
-            'MaSV': ['MaSv', 'MaSV', 'ma_sv', 'MSSV', 'StudentID', 'Mã sinh viên'], # Đã ưu tiên 'MaSv'
-            'HoTen': ['HoTen', 'ho_ten', 'Name', 'Họ tên', 'FullName', 'Họ và tên']
-        }
-        
-        # Find actual column names
-        actual_columns = {}
-        available_columns = list(df.columns)
-        
-        for key, possible_names in column_mapping.items():
-            for name in possible_names:
-                if name in available_columns:
-                    actual_columns[key] = name
-                    break
-        
-        # Handle missing columns with default values
-        if 'SoMonHocLai' not in actual_columns:
-            print("SoMonHocLai column not found, using default values...")
-            df['SoMonHocLai'] = 0
-            actual_columns['SoMonHocLai'] = 'SoMonHocLai'
-        
-        # Đảm bảo cột MaSV được xử lý đúng cách, ưu tiên 'MaSv'
-        if 'MaSV' not in actual_columns: # Nếu không tìm thấy bất kỳ tên nào trong mapping
-            print("MaSV/MaSv column not found, using default values...")
-            df['MaSV'] = [f'SV{i+1:03d}' for i in range(len(df))]
-            actual_columns['MaSV'] = 'MaSV' # Gán tên cột mặc định nếu không tìm thấy
-        
-        if 'HoTen' not in actual_columns:
-            print("HoTen column not found, using default values...")
-            df['HoTen'] = [f'Sinh viên {i+1}' for i in range(len(df))]
-            actual_columns['HoTen'] = 'HoTen'
+        # Resolve column names and fill the optional ones with defaults
+        actual_columns = schema.resolve_columns(df.columns)
+        schema.report_missing(actual_columns, keys=schema.ROSTER_DEFAULTS)
+        actual_columns = schema.apply_defaults(df, actual_columns, keys=schema.ROSTER_DEFAULTS)
+        schema.coerce_columns(df, actual_columns)
         
         # Prepare data using only required columns
-        X = df[[actual_columns['DiemTB'], actual_columns['TinChiRot'], actual_columns['SoMonHocLai']]].values
+        X = schema.features(df, actual_columns)
         y = df[actual_columns['BoHoc']].values
         
-        # Split and scale
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        model.fit(X_train_scaled, y_train)
-        
-        return True
-        
     except Exception as e:
-        print(f"Error during model loading/training: {e}")
+        # Only reading the data falls back; artifact and compile errors below are raised
+        print(f"Error reading training data: {e}")
         # Create sample data with required columns if dulieu1.xlsx fails
         np.random.seed(42)
         n_samples = 200
@@ -87,19 +107,75 @@ def load_and_train_model(filename):
             'HoTen': [f'Sinh viên {i+1}' for i in range(n_samples)]
         })
         
-        X = df[['DiemTB', 'TinChiRot', 'SoMonHocLai']].values
+        X = df[list(schema.FEATURES)].values
         y = df['BoHoc'].values
-        
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_test_scaled = scaler.transform(X_test)
-        
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        model.fit(X_train_scaled, y_train)
-        
-        return True
+    
+    base, _ = model_cache.load_or_train(X, y, MODEL_PARAMS, train_model, force=force)
+    # Keep serving a retrained model published on top of this base
+    forest = model_cache.resolve_published(base.version) or base
+    
+    return True
+
+@app.cli.command('build-model')
+@click.argument('filename', default='dulieu1.xlsx')
+@click.option('--force', is_flag=True, help='Retrain even if a matching artifact exists')
+def build_model_command(filename, force):
+    """Prebuild the model artifact so workers start without retraining"""
+    load_and_train_model(filename, force=force)
+    click.echo(f"Model artifact ready: {forest.version}")
+
+def retrain_from_file(file, filename, mode='warm_start', new_trees=20):
+    """Retrain on a labeled roster, then add it to the training store and swap in the updated model.
+
+    Only one retrain runs at a time; requests keep using the previous forest
+    until the new one is compiled, verified and published. The roster is
+    stored only once the retrain has succeeded, so a rejected or failed
+    retrain leaves the store as it was.
+    """
+    global forest
+    
+    # Before the upload is parsed
+    training.check_retrain_params(mode, new_trees)
+    if not retrain_lock.acquire(blocking=False):
+        raise RuntimeError('Đang huấn luyện lại model, vui lòng thử lại sau')
+    if not training_store.try_lock():
+        retrain_lock.release()
+        raise RuntimeError('Đang huấn luyện lại model, vui lòng thử lại sau')
+    try:
+        if model_cache.current_key() not in (None, forest.version):
+            # Another serve.py worker may have published a newer model since this one started
+            base = (model_cache.load_meta(forest.version) or {}).get('base', forest.version)
+            forest = model_cache.resolve_published(base) or forest
+        X_new, y_new = prepare_batch(*ingestion.read_labeled(file, filename))
+        training.check_retrain_batch(forest.classes, y_new, mode)
+        
+        params = {'mode': mode, 'new_trees': new_trees, 'random_state': MODEL_PARAMS['random_state']}
+        retrain_fn = lambda model, scaler, X, y: training.retrain(
+            model, scaler, X, y, mode=mode, new_trees=new_trees, random_state=MODEL_PARAMS['random_state'])
+        new_forest, key = model_cache.load_or_retrain(forest.version, X_new, y_new, params, retrain_fn)
+        
+        batch = training_store.append(X_new, y_new, source=filename)
+        model_cache.publish(key)
+        forest = new_forest
+        return {
+            'model_version': key,
+            'rows': batch['rows'],
+            'training': model_cache.load_meta(key)['training']
+        }
+    finally:
+        training_store.unlock()
+        retrain_lock.release()
+
+@app.cli.command('retrain')
+@click.argument('filename')
+@click.option('--mode', type=click.Choice(training.RETRAIN_MODES), default='warm_start')
+@click.option('--trees', default=20, type=click.IntRange(min=1), help='Trees added in warm_start mode')
+def retrain_command(filename, mode, trees):
+    """Add a labeled roster and publish the updated model (picked up on restart)"""
+    load_and_train_model('dulieu1.xlsx')
+    with open(filename, 'rb') as file:
+        result = retrain_from_file(file, os.path.basename(filename), mode, trees)
+    click.echo(json.dumps(result, ensure_ascii=False, indent=2))
 
 @app.route('/')
 def index():
@@ -116,11 +192,11 @@ def predict():
         tin_chi_rot = int(data.get('tin_chi_rot', 0))
         so_mon_hoc_lai = int(data.get('so_mon_hoc_lai', 0))
         
-        features = np.array([[diem_tb, tin_chi_rot, so_mon_hoc_lai]])
-        features_scaled = scaler.transform(features)
-        
-        prediction = model.predict(features_scaled)[0]
-        probability = model.predict_proba(features_scaled)[0]
+        # Concurrent requests are scored together in one predict_proba call
+        with metrics.phase('predict'):
+            probability = predict_batcher.predict([diem_tb, tin_chi_rot, so_mon_hoc_lai])
+            prediction = forest.classes[probability.argmax()]
+        metrics.add_rows(1)
         
         dropout_prob = probability[1] * 100
         
@@ -142,92 +218,370 @@ def upload_predict():
     if file.filename == '':
         return jsonify({'error': 'Không có file được chọn'}), 400
     
+    if request.args.get('format') == 'ndjson':
+        # The request closes its upload when the view returns, so the
+        # generator reads from its own copy on disk
+        path = ingestion.spool_upload(file)
+        return Response(stream_with_context(metrics.stream(ndjson_stream(path, file.filename), request.method)),
+                        mimetype='application/x-ndjson')
+    
     try:
-        df = pd.read_excel(file)
-        print("Columns in uploaded file:", df.columns.tolist())
-        
-        # Define column mappings for required columns
-        column_mappings = {
-            'DiemTB': ['DiemTB', 'diem_tb', 'AverageScore', 'Score', 'Điểm TB', 'Điểm trung bình'],
-            'TinChiRot': ['TinChiRot', 'tin_chi_rot', 'FailedCredits', 'Tín chỉ rớt', 'SoTinChiRot', 'Số tín chỉ rớt'],
-            'SoMonHocLai': ['SoMonHocLai', 'so_mon_hoc_lai', 'FailedSubjects', 'Số môn học lại', 'MonHocLai'],
-            'MaSV': ['MaSv', 'MaSV', 'ma_sv', 'MSSV', 'StudentID', 'Mã sinh viên'], # Đã ưu tiên 'MaSv'
-            'HoTen': ['HoTen', 'ho_ten', 'Name', 'Họ tên', 'FullName', 'Họ và tên'],
-            'Lop': ['Lop', 'lop', 'Class', 'Lớp', 'ClassName']
-        }
+        # Score the upload chunk by chunk so peak memory stays bounded
+        frames = list(score_upload(file.stream, file.filename))
+        results = pd.concat(frames, ignore_index=True)
         
-        # Find actual columns
-        actual_columns = {}
-        available_columns = list(df.columns)
-        
-        for key, possible_names in column_mappings.items():
-            for name in possible_names:
-                if name in available_columns:
-                    actual_columns[key] = name
-                    break
-        
-        # Handle missing columns with default values
-        if 'SoMonHocLai' not in actual_columns:
-            print("SoMonHocLai column not found, using default values...")
-            df['SoMonHocLai'] = 0
-            actual_columns['SoMonHocLai'] = 'SoMonHocLai'
-        
-        # Đảm bảo cột MaSV được xử lý đúng cách, ưu tiên 'MaSv'
-        if 'MaSV' not in actual_columns: # Nếu không tìm thấy bất kỳ tên nào trong mapping
-            print("MaSV/MaSv column not found, using default values...")
-            df['MaSV'] = [f'SV{i+1:03d}' for i in range(len(df))]
-            actual_columns['MaSV'] = 'MaSV' # Gán tên cột mặc định nếu không tìm thấy
-            
-        if 'HoTen' not in actual_columns:
-            print("HoTen column not found, using default values...")
-            df['HoTen'] = [f'Sinh viên {i+1}' for i in range(len(df))]
-            actual_columns['HoTen'] = 'HoTen'
-
-        # Thêm xử lý cho cột 'Lop' nếu nó không có trong file, để tránh lỗi khi truy cập
-        if 'Lop' not in actual_columns:
-            print("Lop column not found in uploaded file, using default value 'Unknown Class'.")
-            df['Lop'] = 'Unknown Class'
-            actual_columns['Lop'] = 'Lop'
-        
-        # Đảm bảo đọc đúng mã sinh viên và loại bỏ khoảng trắng
-        # Sử dụng actual_columns['MaSV'] để truy cập tên cột đã được xác định
-        df[actual_columns['MaSV']] = df[actual_columns['MaSV']].astype(str).str.strip()
-        
-        # Ensure all values are numeric for prediction features
-        df[actual_columns['DiemTB']] = pd.to_numeric(df[actual_columns['DiemTB']], errors='coerce').fillna(0)
-        df[actual_columns['TinChiRot']] = pd.to_numeric(df[actual_columns['TinChiRot']], errors='coerce').fillna(0)
-        df[actual_columns['SoMonHocLai']] = pd.to_numeric(df[actual_columns['SoMonHocLai']], errors='coerce').fillna(0)
-        
-        # Prepare features using only required columns
-        features = df[[actual_columns['DiemTB'], actual_columns['TinChiRot'], actual_columns['SoMonHocLai']]].values
-        features_scaled = scaler.transform(features)
-        
-        # Predict
-        predictions = model.predict(features_scaled)
-        probabilities = model.predict_proba(features_scaled)
-        
-        # Prepare results
-        results = []
-        for index, row in df.iterrows():
-            result = {
-                'stt': int(index + 1),
-                'masv': str(row[actual_columns['MaSV']]).strip(),
-                'hoten': str(row[actual_columns['HoTen']]),
-                'lop': str(row[actual_columns['Lop']]),
-                'DiemTB': float(row[actual_columns['DiemTB']]),
-                'tin_chi_rot': int(row[actual_columns['TinChiRot']]),
-                'so_mon_hoc_lai': int(row[actual_columns['SoMonHocLai']]),
-                'prediction': int(predictions[index]),
-                'dropout_probability': float(probabilities[index][1] * 100)
-            }
-            results.append(result)
-
-        return jsonify({'results': results})
+        # Keep the results server-side so charts/exports only send the ID back
+        result_id = save_results(results, file.filename)
+        
+        with metrics.phase('serialize'):
+            if request.args.get('format') == 'columnar':
+                return columnar_response(results, result_id)
+            return records_response(results, result_id)
         
     except Exception as e:
         print(f"Error details:", str(e))
         return jsonify({'error': f"Lỗi xử lý file: {str(e)}"})
 
+def predict_proba(features):
+    """Class probabilities for raw feature rows, memoized per feature triple"""
+    # Read the global once so a concurrent swap cannot mix two model versions
+    current = forest
+    return prediction_cache.predict_proba(features, current.version, current.predict_proba)
+
+def explain(features, current=None):
+    """Dropout risk split into base rate + one share per feature (percentage points), memoized per feature triple"""
+    current = current or forest
+    if len(features) == 0:
+        return np.empty((0, 1 + len(schema.FEATURES)))
+    return contribution_cache.lookup(features, current.version, current.contributions) * 100
+
+# Single-row predictions from /predict and /api/student are micro-batched
+predict_batcher = MicroBatcher(
+    predict_proba,
+    max_batch_size=int(os.environ.get('PREDICT_BATCH_MAX_SIZE', 64)),
+    max_wait_ms=float(os.environ.get('PREDICT_BATCH_MAX_WAIT_MS', 2))
+)
+
+def score_upload(file, filename, chunk_size=ingestion.DEFAULT_CHUNK_SIZE, predict_fn=None, model=None):
+    """Read an uploaded roster in chunks and yield one results DataFrame per chunk"""
+    # One model for the whole upload, even if a retrain swaps it meanwhile
+    current = model or forest
+    predict_fn = predict_fn or (
+        lambda features: prediction_cache.predict_proba(features, current.version, current.predict_proba))
+    actual_columns = None
+    offset = 0
+    # Phases are timed per request; scaling has no phase, it is folded into the forest
+    for chunk in metrics.timed_iter(ingestion.iter_chunks(file, filename, chunk_size), 'parse'):
+        if actual_columns is None:
+            with metrics.phase('columns'):
+                actual_columns = schema.resolve_columns(chunk.columns)
+            schema.report_missing(actual_columns)
+        
+        with metrics.phase('coerce'):
+            chunk, chunk_columns = ingestion.prepare_chunk(chunk, actual_columns, offset)
+            # Prepare features using only required columns
+            features = schema.features(chunk, chunk_columns)
+        
+        with metrics.phase('predict'):
+            if len(features):
+                # Predict: one forest pass, class derived from the probabilities
+                probabilities = predict_fn(features)
+            else:
+                probabilities = np.empty((0, len(current.classes)))
+            predictions = current.classes[probabilities.argmax(axis=1)]
+        
+        with metrics.phase('explain'):
+            contributions = explain(features, current)
+        
+        with metrics.phase('results'):
+            results = build_results_frame(chunk, chunk_columns, predictions, probabilities, offset, contributions)
+        metrics.add_rows(len(results))
+        yield results
+        offset += len(chunk)
+
+# Results columns holding explain()'s output
+CONTRIBUTION_COLUMNS = ['contrib_base'] + [f'contrib_{key}' for key in schema.FEATURES]
+
+def build_results_frame(df, actual_columns, predictions, probabilities, offset=0, contributions=None):
+    """Build the batch prediction results with vectorized column operations.
+
+    contributions (from explain) adds contrib_base and one contrib_<feature>
+    column per model feature, in percentage points of dropout_probability.
+    """
+    columns = {
+        'stt': np.arange(offset + 1, offset + len(df) + 1),
+        'masv': df[actual_columns['MaSV']].astype(str).str.strip().to_numpy(),
+        'hoten': df[actual_columns['HoTen']].astype(str).to_numpy(),
+        'lop': df[actual_columns['Lop']].astype(str).to_numpy(),
+    }
+    if 'Khoa' in actual_columns:
+        columns['khoa'] = df[actual_columns['Khoa']].astype(str).to_numpy()
+    columns.update({
+        'DiemTB': df[actual_columns['DiemTB']].to_numpy(dtype=np.float64),
+        'tin_chi_rot': df[actual_columns['TinChiRot']].to_numpy(dtype=np.float64).astype(np.int64),
+        'so_mon_hoc_lai': df[actual_columns['SoMonHocLai']].to_numpy(dtype=np.float64).astype(np.int64),
+        'prediction': np.asarray(predictions).astype(np.int64),
+        'dropout_probability': probabilities[:, 1] * 100
+    })
+    if contributions is not None:
+        for name, values in zip(CONTRIBUTION_COLUMNS, contributions.T):
+            columns[name] = values
+    return pd.DataFrame(columns)
+
+def save_results(results, filename, model_version=None):
+    """Cache a scored roster for charts/exports and persist it as a cohort; returns its ID"""
+    result_id = result_cache.put(results)
+    cohort_store.put(result_id, results, filename, model_version or forest.version)
+    return result_id
+
+def records_response(results, result_id):
+    """{"result_id": ..., "results": [{...}, ...]} serialized by pandas in one pass"""
+    payload = results.to_json(orient='records', force_ascii=False, double_precision=15)
+    return app.response_class('{"result_id":%s,"results":%s}' % (json.dumps(result_id), payload),
+                              mimetype='application/json')
+
+def columnar_json(results):
+    """{name: [...], ...} for every results column"""
+    return '{%s}' % ','.join(
+        json.dumps(name) + ':' + results[name].to_json(orient='values', force_ascii=False, double_precision=15)
+        for name in results.columns
+    )
+
+def columnar_response(results, result_id):
+    """Compact columnar payload: {"format": "columnar", "result_id": ..., "length": n, "columns": {name: [...]}}"""
+    payload = '{"format":"columnar","result_id":%s,"length":%d,"columns":%s}' % (
+        json.dumps(result_id), len(results), columnar_json(results))
+    return app.response_class(payload, mimetype='application/json')
+
+def ndjson_stream(path, filename):
+    """Yield one JSON line per scored chunk, then a final line with the result ID.
+
+    Lines look like {"type": "chunk", "progress": {...}, "length": n, "columns": {...}},
+    {"type": "done", "result_id": ..., "total": n, "progress": {...}} or
+    {"type": "error", "error": ...}. The row estimate is only an upper bound
+    (blank formatted rows count in it), so the last chunk and the done line
+    report the real total at 100%. The spooled upload at path is removed
+    once the stream ends.
+    """
+    frames = []
+    done = 0
+    try:
+        file = open(path, 'rb')
+    except OSError as e:
+        yield json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False) + '\n'
+        return
+    
+    def chunk_line(results, total):
+        progress = {
+            'rows': done,
+            'total': total,
+            'percent': round(min(done / total, 1) * 100, 2) if total else None
+        }
+        with metrics.phase('serialize'):
+            return '{"type":"chunk","progress":%s,"length":%d,"columns":%s}\n' % (
+                json.dumps(progress), len(results), columnar_json(results))
+    
+    try:
+        total = ingestion.estimate_rows(file, filename)
+        for results in score_upload(file, filename):
+            # Each chunk is sent once the next one is scored, so the last one is known
+            if frames:
+                yield chunk_line(frames[-1], total)
+            frames.append(results)
+            done += len(results)
+        yield chunk_line(frames[-1], done)
+        
+        # Only the compact results are kept, for /chart_data and the exports
+        result_id = save_results(pd.concat(frames, ignore_index=True), filename)
+        yield json.dumps({'type': 'done', 'result_id': result_id, 'total': done,
+                          'progress': {'rows': done, 'total': done, 'percent': 100.0}}) + '\n'
+        
+    except Exception as e:
+        print("Error details:", str(e))
+        yield json.dumps({'type': 'error', 'error': f"Lỗi xử lý file: {str(e)}"}, ensure_ascii=False) + '\n'
+    finally:
+        file.close()
+        os.remove(path)
+
+def get_request_results():
+    """Results for chart/export endpoints as (DataFrame, error_response).
+
+    Clients send {"result_id": ...} returned by /upload_predict; an inline
+    {"results": [...]} list is still accepted for older clients.
+    """
+    data = request.json or {}
+    result_id = data.get('result_id')
+    if not result_id:
+        return pd.DataFrame(data.get('results', [])), None
+    
+    frame = load_results(result_id)
+    if frame is None:
+        return None, (jsonify({'error': 'Kết quả đã hết hạn, vui lòng tải lại file'}), 404)
+    return frame, None
+
+def load_results(result_id):
+    """Results for an ID from this process's cache, else from the cohort store
+    (e.g. scored by another serve.py worker); None if unknown"""
+    frame = result_cache.get(result_id)
+    if frame is None:
+        frame = cohort_store.frame(result_id)
+        if frame is not None:
+            result_cache.put(frame, result_id)
+    return frame
+
+def run_scoring_job(path, filename, model_key, progress):
+    """Runs in a job pool process: score a spooled upload and save it as a cohort; returns the result ID.
+
+    The web process reads the results back from the cohort store, so they
+    are not kept in this process's result cache.
+    """
+    try:
+        current = jobs.worker_forest(model_key)
+        with open(path, 'rb') as file:
+            total = ingestion.estimate_rows(file, filename)
+            progress(0, total)
+            frames = []
+            rows = 0
+            for results in score_upload(file, filename, model=current):
+                frames.append(results)
+                rows += len(results)
+                progress(rows, total)
+        # The estimate is an upper bound; the job is complete at the real row count
+        progress(rows, rows)
+        result_id = uuid.uuid4().hex
+        cohort_store.put(result_id, pd.concat(frames, ignore_index=True), filename, model_key)
+        cohort_store.flush(result_id)
+        return result_id
+    finally:
+        os.remove(path)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a batch prediction in the background and return its job ID"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'Không có file được chọn'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'Không có file được chọn'}), 400
+    
+    path = ingestion.spool_upload(file)
+    job_id = job_queue.submit(run_scoring_job, file.filename, path, file.filename, forest.version,
+                              cleanup=partial(ingestion.discard_upload, path))
+    return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status and progress of a background job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Không tìm thấy công việc'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """Results of a finished job (same formats as /upload_predict)"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Không tìm thấy công việc'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Công việc chưa hoàn thành', 'status': job['status']}), 409
+    
+    results = load_results(job['result_id'])
+    if results is None:
+        return jsonify({'error': 'Kết quả đã hết hạn, vui lòng chạy lại'}), 410
+    if request.args.get('format') == 'columnar':
+        return columnar_response(results, job['result_id'])
+    return records_response(results, job['result_id'])
+
+@app.route('/retrain', methods=['POST'])
+def retrain():
+    """Retrain on a labeled roster (with a BoHoc column) and swap the model in without a restart.
+
+    Requires RETRAIN_TOKEN, sent as "Authorization: Bearer <token>"; without
+    a configured token the route is disabled.
+    """
+    if RETRAIN_TOKEN is None:
+        return jsonify({'error': 'Huấn luyện lại qua API đang tắt (đặt RETRAIN_TOKEN để bật)'}), 404
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), RETRAIN_TOKEN.encode()):
+        return jsonify({'error': 'Không có quyền huấn luyện lại model'}), 401
+    
+    if 'file' not in request.files:
+        return jsonify({'error': 'Không có file được chọn'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'Không có file được chọn'}), 400
+    
+    mode = request.form.get('mode', 'warm_start')
+    try:
+        new_trees = int(request.form.get('trees', 20))
+        return jsonify(retrain_from_file(file.stream, file.filename, mode, new_trees))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        # e.g. a corrupt workbook (zipfile.BadZipFile)
+        print("Error details:", str(e))
+        return jsonify({'error': f"Lỗi xử lý file: {str(e)}"}), 400
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Hit rates of the server-side caches"""
+    return jsonify({
+        'prediction_cache': prediction_cache.stats(),
+        'contribution_cache': contribution_cache.stats(),
+        'result_cache': {'entries': len(result_cache)}
+    })
+
+@app.before_request
+def start_request_timing():
+    """Start per-request phase timing (and cProfile when enabled and asked for)"""
+    if request.endpoint in ('static', 'metrics_endpoint'):
+        return
+    profile = metrics.PROFILE_ENABLED and request.headers.get(metrics.PROFILE_HEADER) == '1'
+    metrics.start_request(request.endpoint or 'unknown', profile=profile)
+
+@app.after_request
+def add_server_timing(response):
+    """Expose the phases measured so far in a Server-Timing header"""
+    timings = metrics.current()
+    if timings is not None:
+        timings.status = response.status_code
+        if timings.phases:
+            response.headers['Server-Timing'] = timings.server_timing()
+    return response
+
+@app.teardown_request
+def finish_request_timing(exc):
+    # Streamed bodies (metrics.stream) are recorded when they end instead
+    metrics.finish_request(request.method)
+
+def _prediction_cache_metrics():
+    stats = prediction_cache.stats()
+    return {
+        ('hits',): stats['hits'],
+        ('misses',): stats['misses'],
+        ('entries',): stats['entries']
+    }
+
+metrics.register(metrics.Callback('app_prediction_cache', 'Prediction cache hits, misses and size',
+                                  _prediction_cache_metrics, labels=('stat',)))
+metrics.register(metrics.Callback('app_prediction_cache_hit_ratio', 'Prediction cache hit ratio',
+                                  lambda: {(): prediction_cache.stats()['hit_rate']}))
+metrics.register(metrics.Callback('app_result_cache_entries', 'Upload results kept in the result cache',
+                                  lambda: {(): len(result_cache)}))
+metrics.register(metrics.Callback('app_model_info', 'Model version being served',
+                                  lambda: {(forest.version, forest.n_trees): 1} if forest is not None else {},
+                                  labels=('version', 'trees')))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # Helper function để chuyển đổi NumPy types
 def convert_numpy_types(obj):
     if isinstance(obj, np.integer):
@@ -242,72 +596,19 @@ def convert_numpy_types(obj):
 def chart_data():
     """Provide structured data for various charts"""
     try:
-        data = request.json
-        results = data.get('results', [])
+        frame, error = get_request_results()
+        if error:
+            return error
         
-        if not results:
+        if frame.empty:
             return jsonify({'error': 'Không có dữ liệu'}), 400
         
-        # Chart 1: Dropout rate by class
-        class_data = {}
-        for student in results:
-            lop = student.get('lop', 'Unknown')
-            if lop not in class_data:
-                class_data[lop] = {'total': 0, 'dropout': 0}
-            class_data[lop]['total'] += 1
-            if student.get('prediction', 0) == 1:
-                class_data[lop]['dropout'] += 1
-        
-        class_chart_data = []
-        for lop, data in class_data.items():
-            dropout_rate = (data['dropout'] / data['total'] * 100) if data['total'] > 0 else 0
-            class_chart_data.append({
-                'class': lop,
-                'total_students': data['total'],
-                'dropout_count': data['dropout'],
-                'dropout_rate': round(dropout_rate, 2)
-            })
-        
-        # Chart 2: Overall statistics
-        total_students = len(results)
-        dropout_count = sum(1 for s in results if s.get('prediction', 0) == 1)
-        dropout_rate = (dropout_count / total_students * 100) if total_students > 0 else 0
-        
-        # Chart 3: Score distribution
-        score_ranges = {
-            '0-2': 0, '2-4': 0, '4-6': 0, '6-8': 0, '8-10': 0
-        }
-        for student in results:
-            score = student.get('DiemTB', 0)
-            if score <= 2:
-                score_ranges['0-2'] += 1
-            elif score <= 4:
-                score_ranges['2-4'] += 1
-            elif score <= 6:
-                score_ranges['4-6'] += 1
-            elif score <= 8:
-                score_ranges['6-8'] += 1
-            else:
-                score_ranges['8-10'] += 1
-        
-        # Chart 4: Failed credits distribution
-        failed_credits = {}
-        for student in results:
-            credits = student.get('tin_chi_rot', 0)
-            if credits not in failed_credits:
-                failed_credits[credits] = 0
-            failed_credits[credits] += 1
-        
-        return jsonify({
-            'class_data': class_chart_data,
-            'overall_stats': {
-                'total_students': total_students,
-                'dropout_count': dropout_count,
-                'dropout_rate': round(dropout_rate, 2)
-            },
-            'score_distribution': score_ranges,
-            'failed_credits_distribution': failed_credits
-        })
+        # All chart series in one vectorized pass; bucket edges are configurable
+        score_edges = (request.json or {}).get('score_edges') or aggregation.DEFAULT_SCORE_EDGES
+        with metrics.phase('aggregate'):
+            series = aggregation.chart_series(frame, score_edges)
+        metrics.add_rows(len(frame))
+        return jsonify(series)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -316,8 +617,10 @@ def chart_data():
 def export_chart_data():
     """Export chart data as JSON for download"""
     try:
-        data = request.json
-        results = data.get('results', [])
+        frame, error = get_request_results()
+        if error:
+            return error
+        results = frame.to_dict('records')
         
         if not results:
             return jsonify({'error': 'Không có dữ liệu'}), 400
@@ -331,8 +634,8 @@ def export_chart_data():
             'students': results,
             'summary': {
                 'total_students': len(results),
-                'dropout_count': sum(1 for s in results if s.get('prediction', 0) == 1),
-                'retention_count': sum(1 for s in results if s.get('prediction', 0) == 0)
+                'dropout_count': int((frame['prediction'] == 1).sum()),
+                'retention_count': int((frame['prediction'] == 0).sum())
             }
         }
         
@@ -343,65 +646,86 @@ def export_chart_data():
 
 @app.route('/download_excel', methods=['POST'])
 def download_excel():
-    """Download prediction results as Excel file"""
+    """Download prediction results as Excel (default), ?format=csv or ?format=parquet"""
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in exporting.EXPORT_FORMATS:
+        return jsonify({'error': f'Định dạng không hỗ trợ: {fmt}'}), 400
+    
     try:
-        data = request.json
-        results = data.get('results', [])
+        frame, error = get_request_results()
+        if error:
+            return error
         
-        if not results:
+        if frame.empty:
             return jsonify({'error': 'Không có dữ liệu để xuất'}), 400
         
-        # Create DataFrame with required columns
-        df_export = pd.DataFrame()
-        
-        # Map the data to required columns
-        export_data = []
-        for idx, student in enumerate(results, 1):
-            export_data.append({
-                'STT': idx,
-                'Họ tên': student.get('hoten', ''),
-                'Mã SV': student.get('masv', ''),
-                'Lớp': student.get('lop', ''),
-                'Khoa': student.get('khoa', 'Không xác định'),
-                'Nguy cơ': 'Có nguy cơ' if student.get('prediction', 0) == 1 else 'Không có nguy cơ',
-                'Tỷ lệ bỏ học': f"{student.get('dropout_probability', 0):.2f}%"
-            })
-        
-        df_export = pd.DataFrame(export_data)
-        
-        # Create Excel file in memory
-        from io import BytesIO
-        
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_export.to_excel(writer, sheet_name='Kết quả dự đoán', index=False)
-            
-            # Auto-adjust column widths
-            worksheet = writer.sheets['Kết quả dự đoán']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
-        
-        # Return file as attachment
+        with metrics.phase('export'):
+            df_export = exporting.export_frame(frame)
+        metrics.add_rows(len(df_export))
+        mimetype, extension = exporting.EXPORT_FORMATS[fmt]
+        download_name = f'ket_qua_du_doan_{pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")}{extension}'
+        
+        if fmt == 'csv':
+            body = metrics.stream(metrics.timed_iter(exporting.iter_csv(df_export), 'serialize'), request.method)
+            return Response(stream_with_context(body), mimetype=mimetype,
+                            headers={'Content-Disposition': f'attachment; filename={download_name}'})
+        
+        # Written to a temporary file and streamed from disk; no in-memory copy
         from flask import send_file
         
+        with metrics.phase('serialize'):
+            export_file = exporting.export_file(df_export, fmt)
         return send_file(
-            BytesIO(output.getvalue()),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            export_file,
+            mimetype=mimetype,
             as_attachment=True,
-            download_name=f'ket_qua_du_doan_{pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+            download_name=download_name
         )
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cohorts')
+def list_cohorts():
+    """Stored scored rosters, newest first"""
+    return jsonify({'cohorts': cohort_store.cohorts()})
+
+@app.route('/api/students')
+def query_students():
+    """Filtered, risk-sorted page of a stored cohort (the newest one unless ?cohort=<result_id>).
+
+    Filters: lop, khoa, at_risk=0|1, min_probability (percent). sort=risk|risk_asc,
+    limit (max 1000) and cursor=<next_cursor from the previous page>.
+    """
+    args = request.args
+    try:
+        cohort_id = args.get('cohort')
+        if not cohort_id:
+            newest = cohort_store.cohorts()[:1]
+            cohort_id = newest[0]['id'] if newest else None
+        cohort = cohort_store.cohort(cohort_id) if cohort_id else None
+        if cohort is None:
+            return jsonify({'error': 'Không tìm thấy danh sách sinh viên đã dự đoán'}), 404
+
+        at_risk = args.get('at_risk')
+        with metrics.phase('query'):
+            students, next_cursor = cohort_store.query(
+                cohort_id,
+                lop=args.get('lop'),
+                khoa=args.get('khoa'),
+                at_risk=None if at_risk is None else int(at_risk in ('1', 'true')),
+                min_probability=args.get('min_probability', type=float),
+                sort=args.get('sort', 'risk'),
+                limit=args.get('limit', 50, type=int),
+                cursor=args.get('cursor')
+            )
+        metrics.add_rows(len(students))
+        return jsonify({'cohort': cohort, 'students': students, 'next_cursor': next_cursor})
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -417,74 +741,47 @@ def student_detail_with_id(masv):
 def get_student_detail(masv):
     """API endpoint to get detailed student information."""
     try:
-        # Read the Excel file
-        df = pd.read_excel('dulieu1.xlsx')
-        
-        # Define column mappings
-        column_mappings = {
-            'MaSV': ['MaSv', 'MaSV', 'ma_sv', 'MSSV', 'StudentID', 'Mã sinh viên'],
-            'HoTen': ['HoTen', 'ho_ten', 'Name', 'Họ tên', 'FullName', 'Họ và tên'],
-            'Lop': ['Lop', 'lop', 'Class', 'Lớp', 'ClassName'],
-            'Khoa': ['Khoa', 'khoa', 'Faculty', 'Khoa', 'Department'],
-            'DiemTB': ['DiemTB', 'diem_tb', 'AverageScore', 'Score', 'Điểm TB', 'Điểm trung bình'],
-            'TinChiRot': ['TinChiRot', 'tin_chi_rot', 'FailedCredits', 'Tín chỉ rớt', 'SoTinChiRot', 'Số tín chỉ rớt'],
-            'SoMonHocLai': ['SoMonHocLai', 'so_mon_hoc_lai', 'FailedSubjects', 'Số môn học lại', 'MonHocLai'],
-            'BoHoc': ['BoHoc', 'bo_hoc', 'Dropout', 'Bỏ học']
-        }
-        
-        # Find actual columns
-        actual_columns = {}
-        available_columns = list(df.columns)
-        
-        for key, possible_names in column_mappings.items():
-            for name in possible_names:
-                if name in available_columns:
-                    actual_columns[key] = name
-                    break
-        
-        # Handle missing columns
-        if 'MaSV' not in actual_columns:
-            df['MaSV'] = [f'SV{i+1:03d}' for i in range(len(df))]
-            actual_columns['MaSV'] = 'MaSV'
+        # Look up the student in the in-memory roster index
+        with metrics.phase('lookup'):
+            student, actual_columns = student_store.get(masv)
         
-        # Find student by MaSV
-        student_row = df[df[actual_columns['MaSV']].astype(str).str.strip() == masv.strip()]
-        
-        if student_row.empty:
+        if student is None:
             return jsonify({'error': 'Không tìm thấy sinh viên'}), 404
         
-        # Get student data
-        student = student_row.iloc[0]
-        
         # Prepare features for prediction
-        features = np.array([[
+        features = [
             float(student.get(actual_columns['DiemTB'], 0)),
             int(student.get(actual_columns['TinChiRot'], 0)),
             int(student.get(actual_columns['SoMonHocLai'], 0))
-        ]])
+        ]
         
-        features_scaled = scaler.transform(features)
-        prediction = model.predict(features_scaled)[0]
-        probability = model.predict_proba(features_scaled)[0]
+        with metrics.phase('predict'):
+            probability = predict_batcher.predict(features)
+            prediction = forest.classes[probability.argmax()]
         dropout_prob = probability[1] * 100
         
+        # Why: base rate plus each feature's share of the probability
+        with metrics.phase('explain'):
+            contributions = explain([features])[0]
+        
         # Prepare student detail
         student_detail = {
             'masv': str(student.get(actual_columns['MaSV'], '')).strip(),
             'hoten': str(student.get(actual_columns['HoTen'], '')),
-            'lop': str(student.get(actual_columns['Lop'], 'Không xác định')),
-            'khoa': str(student.get(actual_columns['Khoa'], 'Không xác định')),
+            'lop': str(student.get(actual_columns.get('Lop'), 'Không xác định')),
+            'khoa': str(student.get(actual_columns.get('Khoa'), 'Không xác định')),
             'diem_tb': float(student.get(actual_columns['DiemTB'], 0)),
             'tin_chi_rot': int(student.get(actual_columns['TinChiRot'], 0)),
             'so_mon_hoc_lai': int(student.get(actual_columns['SoMonHocLai'], 0)),
             'prediction': int(prediction),
             'dropout_probability': float(dropout_prob),
             'ty_le_bo_hoc_so': f"{dropout_prob:.2f}%",
-            'ty_le_bo_hoc_chu': "Có nguy cơ bỏ học" if prediction == 1 else "Không có nguy cơ bỏ học"
+            'ty_le_bo_hoc_chu': "Có nguy cơ bỏ học" if prediction == 1 else "Không có nguy cơ bỏ học",
+            'contributions': dict(zip(['base'] + list(schema.FEATURES), contributions.tolist()))
         }
         
         # Add all other columns from Excel
-        for col in df.columns:
+        for col in student.index:
             if col not in actual_columns.values():
                 value = student.get(col)
                 if pd.notna(value):
@@ -0,0 +1,112 @@
+"""Benchmark the /chart_data aggregation: legacy per-dict loops vs aggregation.chart_series.
+
+Usage: python benchmarks/bench_aggregation.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregation  # noqa: E402
+
+
+def make_results(n, seed=42):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'lop': rng.choice([f'CNTT {k:02d}-0{j}' for k in range(15, 20) for j in range(1, 6)], n),
+        'DiemTB': np.round(np.clip(rng.normal(7, 1.5, n), 0, 10), 2),
+        'tin_chi_rot': rng.integers(0, 11, n),
+        'prediction': rng.integers(0, 2, n)
+    })
+
+
+def legacy_chart_series(results):
+    """The loops /chart_data used before the aggregation module"""
+    class_data = {}
+    for student in results:
+        lop = student.get('lop', 'Unknown')
+        if lop not in class_data:
+            class_data[lop] = {'total': 0, 'dropout': 0}
+        class_data[lop]['total'] += 1
+        if student.get('prediction', 0) == 1:
+            class_data[lop]['dropout'] += 1
+
+    class_chart_data = []
+    for lop, data in class_data.items():
+        dropout_rate = (data['dropout'] / data['total'] * 100) if data['total'] > 0 else 0
+        class_chart_data.append({
+            'class': lop,
+            'total_students': data['total'],
+            'dropout_count': data['dropout'],
+            'dropout_rate': round(dropout_rate, 2)
+        })
+
+    total_students = len(results)
+    dropout_count = sum(1 for s in results if s.get('prediction', 0) == 1)
+    dropout_rate = (dropout_count / total_students * 100) if total_students > 0 else 0
+
+    score_ranges = {'0-2': 0, '2-4': 0, '4-6': 0, '6-8': 0, '8-10': 0}
+    for student in results:
+        score = student.get('DiemTB', 0)
+        if score <= 2:
+            score_ranges['0-2'] += 1
+        elif score <= 4:
+            score_ranges['2-4'] += 1
+        elif score <= 6:
+            score_ranges['4-6'] += 1
+        elif score <= 8:
+            score_ranges['6-8'] += 1
+        else:
+            score_ranges['8-10'] += 1
+
+    failed_credits = {}
+    for student in results:
+        credits = student.get('tin_chi_rot', 0)
+        if credits not in failed_credits:
+            failed_credits[credits] = 0
+        failed_credits[credits] += 1
+
+    return {
+        'class_data': class_chart_data,
+        'overall_stats': {
+            'total_students': total_students,
+            'dropout_count': dropout_count,
+            'dropout_rate': round(dropout_rate, 2)
+        },
+        'score_distribution': score_ranges,
+        'failed_credits_distribution': failed_credits
+    }
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'students':>10} {'legacy (s)':>12} {'numpy (s)':>12} {'speedup':>9}")
+    for n in args.sizes:
+        frame = make_results(n)
+        records = frame.to_dict('records')
+        legacy_time, expected = best_of(lambda: legacy_chart_series(records), args.repeat)
+        numpy_time, actual = best_of(lambda: aggregation.chart_series(frame), args.repeat)
+        assert actual == expected, 'aggregation.chart_series differs from the legacy loops'
+        print(f'{n:>10} {legacy_time:>12.4f} {numpy_time:>12.4f} {legacy_time / numpy_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
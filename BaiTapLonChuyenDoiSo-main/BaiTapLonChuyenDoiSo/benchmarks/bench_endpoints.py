@@ -0,0 +1,316 @@
+"""Benchmark the Flask endpoints: latency percentiles, rows/sec and peak RSS, written to JSON.
+
+Runs /predict, /api/student/<masv>, /upload_predict, /chart_data and
+/download_excel against synthetic rosters, either in-process through the
+Flask test client or over HTTP with concurrent clients (a local threaded
+server, or --url for one already running).
+
+Usage:
+  python benchmarks/bench_endpoints.py [--driver client|http] [--sizes 1000 10000]
+                                       [--formats xlsx csv parquet] [--concurrency 8] [--out results.json]
+  python benchmarks/bench_endpoints.py --compare baseline.json results.json [--tolerance 0.1]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import roster  # noqa: E402
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class PeakRss:
+    """Samples this process's resident set size in a thread; peak in MB after the block"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            # Not Linux: lifetime maximum only (kB on Linux, bytes on macOS)
+            import resource
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current()) / 1e6
+
+
+class ClientDriver:
+    """In-process requests through the Flask test client (one client per thread)"""
+
+    name = 'client'
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def request(self, method, path, json_body=None, upload=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        if upload is not None:
+            filename, data = upload
+            response = client.open(path, method=method, data={'file': (io.BytesIO(data), filename)},
+                                   content_type='multipart/form-data')
+        else:
+            response = client.open(path, method=method, json=json_body)
+        return response.status_code, response.get_data()
+
+
+class HttpDriver:
+    """Real HTTP requests with urllib; starts a local threaded server unless given a URL"""
+
+    name = 'http'
+
+    def __init__(self, flask_app=None, url=None):
+        self.server = None
+        if url is None:
+            from werkzeug.serving import make_server
+            self.server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            url = f'http://127.0.0.1:{self.server.port}'
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, json_body=None, upload=None):
+        headers = {}
+        body = None
+        if upload is not None:
+            filename, data = upload
+            boundary = uuid.uuid4().hex
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=600) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def summarize(latencies, rows, wall, errors):
+    latencies_ms = np.asarray(latencies) * 1000
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'wall_seconds': round(wall, 4),
+        'requests_per_sec': round(len(latencies) / wall, 2) if wall else None,
+        'rows_per_sec': round(rows / wall, 1) if wall else None,
+        'latency_ms': {'mean': round(float(latencies_ms.mean()), 3), 'max': round(float(latencies_ms.max()), 3)}
+    }
+    for p in PERCENTILES:
+        summary['latency_ms'][f'p{p}'] = round(float(np.percentile(latencies_ms, p)), 3)
+    return summary
+
+
+def run_scenario(driver, name, requests, rows_per_request, concurrency):
+    """Send (method, path, json, upload) requests with `concurrency` workers and summarize"""
+    def send(spec):
+        start = time.perf_counter()
+        status, _ = driver.request(*spec)
+        return time.perf_counter() - start, status
+
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(send, requests))
+        wall = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in outcomes]
+    errors = sum(1 for _, status in outcomes if status >= 400)
+    result = dict({'endpoint': name, 'driver': driver.name, 'concurrency': concurrency},
+                  **summarize(latencies, rows_per_request * len(requests), wall, errors))
+    result['peak_rss_mb'] = round(rss.peak, 1)
+    lat = result['latency_ms']
+    print(f"{name:<36} {driver.name:<6} n={len(requests):<5} p50={lat['p50']:>9.2f}ms p99={lat['p99']:>9.2f}ms "
+          f"{result['rows_per_sec'] or 0:>12.0f} rows/s  rss={result['peak_rss_mb']:.0f}MB  errors={errors}")
+    return result
+
+
+def student_ids(filename='dulieu1.xlsx'):
+    import schema
+
+    df = pd.read_excel(filename)
+    columns = schema.resolve_columns(df.columns)
+    return df[columns['MaSV']].astype(str).str.strip().tolist() if 'MaSV' in columns else []
+
+
+def run(args):
+    os.chdir(APP_DIR)
+    import app as flask_app
+
+    flask_app.load_and_train_model('dulieu1.xlsx')
+    if args.driver == 'http':
+        driver = HttpDriver(flask_app.app, args.url)
+    else:
+        driver = ClientDriver(flask_app.app)
+
+    rng = np.random.default_rng(0)
+    results = []
+    try:
+        # Single-row endpoints
+        features = np.column_stack([np.round(rng.uniform(0, 10, args.requests), 2),
+                                    rng.integers(0, 10, args.requests), rng.integers(0, 5, args.requests)])
+        requests = [('POST', '/predict', {'diem_tb': float(d), 'tin_chi_rot': int(t), 'so_mon_hoc_lai': int(s)}, None)
+                    for d, t, s in features]
+        results.append(run_scenario(driver, 'predict', requests, 1, args.concurrency))
+
+        ids = student_ids()
+        if ids:
+            requests = [('GET', f'/api/student/{masv}', None, None) for masv in rng.choice(ids, args.requests)]
+            results.append(run_scenario(driver, 'api_student', requests, 1, args.concurrency))
+
+        # Batch endpoints, per roster size and upload format
+        for n in args.sizes:
+            result_id = None
+            for fmt in roster.available_formats(args.formats):
+                path = roster.roster_path(n, fmt, args.data)
+                with open(path, 'rb') as f:
+                    upload = (os.path.basename(path), f.read())
+                requests = [('POST', '/upload_predict', None, upload)] * args.repeat
+                result = run_scenario(driver, f'upload_predict[{fmt}]', requests, n, args.upload_concurrency)
+                results.append(dict(result, rows=n, format=fmt))
+
+                if result_id is None:
+                    status, body = driver.request('POST', '/upload_predict', None, upload)
+                    result_id = json.loads(body)['result_id'] if status == 200 else None
+            if result_id is None:
+                continue
+
+            payload = {'result_id': result_id}
+            for name, path in (('chart_data', '/chart_data'), ('download_excel[xlsx]', '/download_excel'),
+                               ('download_excel[csv]', '/download_excel?format=csv')):
+                requests = [('POST', path, payload, None)] * args.repeat
+                result = run_scenario(driver, name, requests, n, args.upload_concurrency)
+                results.append(dict(result, rows=n))
+    finally:
+        if isinstance(driver, HttpDriver):
+            driver.close()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'model_version': flask_app.forest.version,
+            'args': {k: v for k, v in vars(args).items() if k != 'compare'}
+        },
+        'results': results
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result['endpoint'], result['driver'], result.get('rows'), result['concurrency'])
+
+
+def compare(baseline_file, current_file, tolerance):
+    """Print p50/p99 and rows/sec changes; returns the number of regressions beyond tolerance"""
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+    with open(current_file, encoding='utf-8') as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'endpoint':<36} {'rows':>8} {'p50':>8} {'p99':>8} {'rows/s':>8}")
+    for result in current:
+        before = baseline.get(result_key(result))
+        if before is None:
+            continue
+        changes = [
+            result['latency_ms']['p50'] / before['latency_ms']['p50'] - 1,
+            result['latency_ms']['p99'] / before['latency_ms']['p99'] - 1,
+            (before['rows_per_sec'] / result['rows_per_sec'] - 1) if result['rows_per_sec'] else float('inf')
+        ]
+        flag = ''
+        if max(changes) > tolerance:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{result['endpoint']:<36} {result.get('rows') or '':>8} "
+              + ' '.join(f'{change:>+8.1%}' for change in changes) + flag)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--driver', choices=('client', 'http'), default='client')
+    parser.add_argument('--url', help='Benchmark an already running server (http driver)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--formats', nargs='+', choices=roster.FORMATS, default=list(roster.FORMATS))
+    parser.add_argument('--requests', type=int, default=500, help='Requests for the single-row endpoints')
+    parser.add_argument('--repeat', type=int, default=3, help='Requests per batch endpoint and roster size')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--upload-concurrency', type=int, default=1)
+    parser.add_argument('--data', default=roster.DEFAULT_OUT, help='Directory for generated rosters')
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'))
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed slowdown before flagging')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.tolerance) else 0)
+
+    # Relative to the caller's directory: run() switches to the app directory
+    args.out = os.path.abspath(args.out)
+    args.data = os.path.abspath(args.data)
+    report = run(args)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'Results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
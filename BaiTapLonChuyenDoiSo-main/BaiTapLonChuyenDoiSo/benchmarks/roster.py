@@ -0,0 +1,90 @@
+"""Generate synthetic student rosters for the endpoint benchmarks.
+
+Same columns and distributions as the fallback data in load_and_train_model,
+plus the identity columns an uploaded roster has.
+
+Usage: python benchmarks/roster.py [--rows 1000 100000 1000000] [--formats xlsx csv parquet] [--out DIR]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+FORMATS = ('xlsx', 'csv', 'parquet')
+
+
+def make_roster(n, seed=42):
+    rng = np.random.default_rng(seed)
+    classes = np.array([f'CNTT {k:02d}-0{j}' for k in range(15, 20) for j in range(1, 6)])
+    faculties = np.array(['Công nghệ thông tin', 'Kinh tế', 'Điện tử', 'Ngoại ngữ'])
+    ids = np.arange(1, n + 1)
+    return pd.DataFrame({
+        'MaSv': np.char.add('SV', np.char.zfill(ids.astype(str), 7)),
+        'HoTen': np.char.add('Sinh viên ', ids.astype(str)),
+        'Lop': rng.choice(classes, n),
+        'Khoa': rng.choice(faculties, n),
+        'DiemTB': np.round(np.clip(rng.normal(7, 1.5, n), 0, 10), 2),
+        'TinChiRot': rng.integers(0, 10, n),
+        'SoMonHocLai': rng.integers(0, 5, n)
+    })
+
+
+def write_roster(df, path, fmt):
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        # Write-only workbook: pandas' default writer is too slow for 1M rows
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Sheet1')
+        worksheet.append(list(df.columns))
+        for row in df.itertuples(index=False, name=None):
+            worksheet.append(row)
+        workbook.save(path)
+
+
+def roster_path(n, fmt, out=DEFAULT_OUT, seed=42):
+    """Path of the n-student roster in fmt, generating it on first use"""
+    path = os.path.join(out, f'roster_{n}_{seed}.{fmt}')
+    if not os.path.exists(path):
+        os.makedirs(out, exist_ok=True)
+        tmp_path = f'{path}.tmp.{fmt}'
+        write_roster(make_roster(n, seed), tmp_path, fmt)
+        os.replace(tmp_path, path)
+    return path
+
+
+def available_formats(formats=FORMATS):
+    """Formats that can be written here (Parquet needs pyarrow)"""
+    try:
+        import pyarrow  # noqa: F401
+        return list(formats)
+    except ImportError:
+        return [fmt for fmt in formats if fmt != 'parquet']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    formats = available_formats(args.formats)
+    if len(formats) < len(args.formats):
+        print('pyarrow is not installed, skipping parquet')
+    for n in args.rows:
+        for fmt in formats:
+            path = roster_path(n, fmt, args.out, args.seed)
+            print(f'{path} ({os.path.getsize(path) / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+COHORT_FIELDS = ('id', 'filename', 'rows', 'at_risk', 'model_version', 'created_at')
+
+# Results frame column -> students table column
+COLUMNS = {
+    'stt': 'stt',
+    'masv': 'masv',
+    'hoten': 'hoten',
+    'lop': 'lop',
+    'khoa': 'khoa',
+    'DiemTB': 'diem_tb',
+    'tin_chi_rot': 'tin_chi_rot',
+    'so_mon_hoc_lai': 'so_mon_hoc_lai',
+    'prediction': 'prediction',
+    'dropout_probability': 'probability',
+    'contrib_base': 'contrib_base',
+    'contrib_DiemTB': 'contrib_diem_tb',
+    'contrib_TinChiRot': 'contrib_tin_chi_rot',
+    'contrib_SoMonHocLai': 'contrib_so_mon_hoc_lai'
+}
+
+# Columns not every cohort has: uploads without Khoa, cohorts saved before contributions
+OPTIONAL_COLUMNS = ('khoa', 'contrib_base', 'contrib_DiemTB', 'contrib_TinChiRot', 'contrib_SoMonHocLai')
+
+# sort -> (ORDER BY, keyset condition after the row (probability, stt));
+# ties on probability are broken by stt so every row has a unique position
+SORTS = {
+    'risk': ('probability DESC, stt ASC', 'probability <= ? AND (probability < ? OR stt > ?)'),
+    'risk_asc': ('probability ASC, stt DESC', 'probability >= ? AND (probability > ? OR stt < ?)')
+}
+
+# Positions of the keyset fields in a row selected with COLUMNS
+PROBABILITY_INDEX = list(COLUMNS).index('dropout_probability')
+STT_INDEX = list(COLUMNS).index('stt')
+
+MAX_PAGE_SIZE = 1000
+
+INSERT_BATCH_ROWS = 10000
+
+
+def encode_cursor(probability, stt):
+    """Opaque keyset cursor for the row after which the next page starts"""
+    return base64.urlsafe_b64encode(json.dumps([probability, stt]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        probability, stt = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return float(probability), int(stt)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor không hợp lệ')
+
+
+class CohortStore:
+    """Scored rosters persisted in SQLite, queryable without the original upload.
+
+    Every batch prediction result is saved as a cohort under its result ID.
+    Students are indexed by (cohort, probability), and by class, faculty and
+    risk flag each followed by probability, so filtered top-N queries and
+    keyset pagination read only the rows they return. With ``write_behind``
+    writes happen on one background thread so uploads do not wait for them;
+    reads of a cohort still being written wait for it. Only the newest
+    ``max_cohorts`` are kept.
+    """
+
+    def __init__(self, path, max_cohorts=20, write_behind=True):
+        self.path = path
+        self.max_cohorts = max_cohorts
+        self.write_behind = write_behind
+        self._local = threading.local()
+        self._pending = {}  # cohort id -> Future of its write
+        self._pending_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cohort-writer')
+        # Short-lived connection: a forked server worker must not inherit an open one
+        conn = sqlite3.connect(self.path, timeout=30)
+        with conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS cohorts (
+                    id TEXT PRIMARY KEY, filename TEXT, rows INTEGER, at_risk INTEGER,
+                    model_version TEXT, created_at REAL);
+                CREATE TABLE IF NOT EXISTS students (
+                    cohort_id TEXT, stt INTEGER, masv TEXT, hoten TEXT, lop TEXT, khoa TEXT,
+                    diem_tb REAL, tin_chi_rot INTEGER, so_mon_hoc_lai INTEGER,
+                    prediction INTEGER, probability REAL, contrib_base REAL, contrib_diem_tb REAL,
+                    contrib_tin_chi_rot REAL, contrib_so_mon_hoc_lai REAL,
+                    PRIMARY KEY (cohort_id, stt)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS students_risk ON students (cohort_id, probability DESC, stt);
+                CREATE INDEX IF NOT EXISTS students_lop ON students (cohort_id, lop, probability DESC, stt);
+                CREATE INDEX IF NOT EXISTS students_khoa ON students (cohort_id, khoa, probability DESC, stt);
+                CREATE INDEX IF NOT EXISTS students_flag ON students (cohort_id, prediction, probability DESC, stt);
+            ''')
+            # Databases created before a column was added
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(students)')}
+            for column in COLUMNS.values():
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE students ADD COLUMN {column} REAL')
+        conn.close()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def put(self, cohort_id, results, filename=None, model_version=None):
+        """Save a results DataFrame as cohort_id (queued, unless write_behind is off).
+
+        Without write_behind a failed write raises, so callers never hand out
+        an ID that has no stored cohort; queued writes raise from flush().
+        """
+        if not self.write_behind:
+            try:
+                self._write(cohort_id, results, filename, model_version)
+            except Exception as e:
+                print(f"Error saving cohort {cohort_id}:", str(e))
+                raise
+            return
+        with self._pending_lock:
+            future = self._pending[cohort_id] = self._writer.submit(
+                self._write, cohort_id, results, filename, model_version)
+        future.add_done_callback(lambda _: self._done(cohort_id, future))
+
+    def _done(self, cohort_id, future):
+        with self._pending_lock:
+            if self._pending.get(cohort_id) is future:
+                del self._pending[cohort_id]
+        if future.exception() is not None:
+            print(f"Error saving cohort {cohort_id}:", str(future.exception()))
+
+    def _write(self, cohort_id, results, filename, model_version):
+        n = len(results)
+        # Plain Python values: sqlite3 cannot bind NumPy scalars
+        columns = [results[name].tolist() if name in results else [None] * n for name in COLUMNS]
+        at_risk = int((results['prediction'] == 1).sum()) if 'prediction' in results else 0
+
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT INTO cohorts (%s) VALUES (?, ?, ?, ?, ?, ?)' % ', '.join(COHORT_FIELDS),
+                         (cohort_id, filename, n, at_risk, model_version, time.time()))
+            sql = 'INSERT INTO students (cohort_id, %s) VALUES (?%s)' % (
+                ', '.join(COLUMNS.values()), ', ?' * len(COLUMNS))
+            for start in range(0, n, INSERT_BATCH_ROWS):
+                stop = min(start + INSERT_BATCH_ROWS, n)
+                conn.executemany(sql, ((cohort_id,) + row for row in zip(*(c[start:stop] for c in columns))))
+        self._prune(conn)
+
+    def _prune(self, conn):
+        stale = [row[0] for row in conn.execute(
+            'SELECT id FROM cohorts ORDER BY created_at DESC LIMIT -1 OFFSET ?', (self.max_cohorts,))]
+        for cohort_id in stale:
+            with conn:
+                conn.execute('DELETE FROM students WHERE cohort_id = ?', (cohort_id,))
+                conn.execute('DELETE FROM cohorts WHERE id = ?', (cohort_id,))
+
+    def flush(self, cohort_id=None):
+        """Block until cohort_id (or every queued cohort) has been written"""
+        with self._pending_lock:
+            futures = list(self._pending.values()) if cohort_id is None else [self._pending.get(cohort_id)]
+        for future in futures:
+            if future is not None:
+                future.result()
+
+    def cohort(self, cohort_id):
+        """Cohort summary dict, or None if unknown"""
+        self.flush(cohort_id)
+        row = self._connect().execute(
+            'SELECT %s FROM cohorts WHERE id = ?' % ', '.join(COHORT_FIELDS), (cohort_id,)).fetchone()
+        return dict(zip(COHORT_FIELDS, row)) if row else None
+
+    def cohorts(self):
+        """Summaries of the stored cohorts, newest first"""
+        self.flush()
+        rows = self._connect().execute('SELECT %s FROM cohorts ORDER BY created_at DESC' % ', '.join(COHORT_FIELDS))
+        return [dict(zip(COHORT_FIELDS, row)) for row in rows]
+
+    def frame(self, cohort_id):
+        """A stored cohort as a results DataFrame (same columns as the upload's), or None"""
+        self.flush(cohort_id)
+        conn = self._connect()
+        if conn.execute('SELECT 1 FROM cohorts WHERE id = ?', (cohort_id,)).fetchone() is None:
+            return None
+        rows = conn.execute('SELECT %s FROM students WHERE cohort_id = ? ORDER BY stt' % ', '.join(COLUMNS.values()),
+                            (cohort_id,)).fetchall()
+        frame = pd.DataFrame.from_records(rows, columns=list(COLUMNS))
+        return frame.drop(columns=[name for name in OPTIONAL_COLUMNS if frame[name].isna().all()])
+
+    def query(self, cohort_id, lop=None, khoa=None, at_risk=None, min_probability=None,
+              sort='risk', limit=50, cursor=None):
+        """One page of a cohort's students; returns (rows, next_cursor or None).
+
+        Rows use the results frame's field names, so they render like the
+        /upload_predict output. Filters combine with AND.
+        """
+        if sort not in SORTS:
+            raise ValueError(f"sort phải là một trong: {', '.join(SORTS)}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        self.flush(cohort_id)
+
+        order_by, after = SORTS[sort]
+        conditions = ['cohort_id = ?']
+        params = [cohort_id]
+        for column, value in (('lop', lop), ('khoa', khoa), ('prediction', at_risk)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        if min_probability is not None:
+            conditions.append('probability >= ?')
+            params.append(float(min_probability))
+        if cursor:
+            probability, stt = decode_cursor(cursor)
+            conditions.append(after)
+            params.extend([probability, probability, stt])
+
+        sql = 'SELECT %s FROM students WHERE %s ORDER BY %s LIMIT ?' % (
+            ', '.join(COLUMNS.values()), ' AND '.join(conditions), order_by)
+        # One extra row tells whether another page exists
+        rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][PROBABILITY_INDEX], rows[-1][STT_INDEX])
+        return [dict(zip(COLUMNS, row)) for row in rows], next_cursor
@@ -0,0 +1,96 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+SHEET_NAME = 'Kết quả dự đoán'
+
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+    'csv': ('text/csv; charset=utf-8', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet')
+}
+
+# Rows per CSV piece sent to the client
+CSV_CHUNK_ROWS = 10000
+
+MAX_COLUMN_WIDTH = 50
+
+
+def _column(results, name, default):
+    if name in results:
+        return results[name].values
+    return np.full(len(results), default, dtype=object)
+
+
+def export_frame(results):
+    """Results frame -> the exported table, built column by column"""
+    prediction = results['prediction'].values if 'prediction' in results else np.zeros(len(results))
+    probability = (results['dropout_probability'].values.astype(np.float64)
+                   if 'dropout_probability' in results else np.zeros(len(results)))
+    return pd.DataFrame({
+        'STT': np.arange(1, len(results) + 1),
+        'Họ tên': _column(results, 'hoten', ''),
+        'Mã SV': _column(results, 'masv', ''),
+        'Lớp': _column(results, 'lop', ''),
+        'Khoa': _column(results, 'khoa', 'Không xác định'),
+        'Nguy cơ': np.where(prediction == 1, 'Có nguy cơ', 'Không có nguy cơ'),
+        'Tỷ lệ bỏ học': np.char.mod('%.2f%%', probability)
+    })
+
+
+def column_widths(df):
+    """Auto-fit width per column: longest value or header + 2, capped at MAX_COLUMN_WIDTH"""
+    widths = []
+    for name in df.columns:
+        longest = df[name].astype(str).str.len().max() if len(df) else 0
+        widths.append(min(max(len(str(name)), int(longest)) + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def write_xlsx(df, file):
+    """Write df with a write-only (constant memory) openpyxl workbook"""
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(SHEET_NAME)
+    # Write-only sheets take column widths only before the first row
+    for i, width in enumerate(column_widths(df), 1):
+        worksheet.column_dimensions[get_column_letter(i)].width = width
+    worksheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        worksheet.append(row)
+    workbook.save(file)
+
+
+def iter_csv(df, chunk_rows=CSV_CHUNK_ROWS):
+    """CSV bytes in pieces; starts with a BOM so Excel reads the Vietnamese text as UTF-8"""
+    yield '\ufeff'.encode('utf-8') + df.iloc[:0].to_csv(index=False).encode('utf-8')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode('utf-8')
+
+
+def write_parquet(df, file):
+    """Write df as Parquet; needs pyarrow"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ValueError('Xuất Parquet cần cài đặt pyarrow')
+    df.to_parquet(file, index=False)
+
+
+def export_file(df, fmt):
+    """xlsx/parquet export spooled to a temporary file, rewound for streaming"""
+    file = tempfile.TemporaryFile()
+    try:
+        if fmt == 'parquet':
+            write_parquet(df, file)
+        else:
+            write_xlsx(df, file)
+    except Exception:
+        file.close()
+        raise
+    file.seek(0)
+    return file
@@ -0,0 +1,312 @@
+import json
+import os
+
+import numpy as np
+
+
+# Arrays making up a compiled forest; saved as one .npy each so they can be memory-mapped
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+GRID_ARRAY_NAMES = ('grid_edges', 'grid_sizes', 'grid_proba', 'grid_contributions')
+
+# Class whose probability grid_contributions decomposes (dropout)
+CONTRIBUTION_CLASS = 1
+
+# Largest split grid (product of per-feature cell counts) worth tabulating
+MAX_GRID_CELLS = int(os.environ.get('FOREST_MAX_GRID_CELLS', 2000000))
+
+INT64_MIN = np.iinfo(np.int64).min
+SIGN_MASK = np.int64(0x7FFFFFFFFFFFFFFF)
+
+
+def _ordered(values):
+    """Map float64 to int64 so that integer order equals float order"""
+    bits = values.view(np.int64)
+    return np.where(bits >= 0, bits, -(bits & SIGN_MASK))
+
+
+def _unordered(ordered):
+    bits = np.where(ordered >= 0, ordered, (-ordered) | np.int64(INT64_MIN))
+    return bits.astype(np.int64).view(np.float64)
+
+
+def fold_thresholds(thresholds, mean, scale):
+    """Raw-space thresholds reproducing sklearn's split on scaled float32 inputs.
+
+    sklearn goes left when float32((x - mean) / scale) <= t. That predicate is
+    monotone in x, so for each node we bisect over float64 values for the
+    largest x that still goes left; comparing raw x <= x* then gives exactly
+    the same decisions without scaling at serve time.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    def goes_left(x):
+        return ((x - mean) / scale).astype(np.float32) <= thresholds
+
+    guess = thresholds * scale + mean
+    width = np.maximum(np.abs(guess), 1.0) * 1e-4
+    lo = guess - width
+    hi = guess + width
+    # Widen until lo goes left and hi goes right
+    for _ in range(64):
+        bad_lo = ~goes_left(lo)
+        bad_hi = goes_left(hi)
+        if not bad_lo.any() and not bad_hi.any():
+            break
+        width = width * 2
+        lo = np.where(bad_lo, guess - width, lo)
+        hi = np.where(bad_hi, guess + width, hi)
+
+    lo_o, hi_o = _ordered(lo), _ordered(hi)
+    while True:
+        open_ = hi_o - lo_o > 1
+        if not open_.any():
+            break
+        mid_o = lo_o + (hi_o - lo_o) // 2
+        left = goes_left(_unordered(mid_o))
+        lo_o = np.where(open_ & left, mid_o, lo_o)
+        hi_o = np.where(open_ & ~left, mid_o, hi_o)
+    return _unordered(lo_o)
+
+
+class CompiledForest:
+    """A RandomForestClassifier + StandardScaler flattened into NumPy arrays.
+
+    All trees share one node table: ``feature``/``threshold`` (already in raw
+    feature units), ``left``/``right`` child indices (leaves point to
+    themselves), and ``value``, the class distribution at every node.
+    Scoring walks all trees for a block of rows at once with fancy indexing.
+
+    With few features the split thresholds of all trees cut feature space
+    into a grid on which the whole forest is constant. When that grid is
+    small enough its probabilities are tabulated once (``grid_*`` arrays)
+    and scoring becomes one searchsorted per feature plus a table lookup.
+
+    contributions() splits a probability into the forest's base rate plus
+    one term per feature (tree-path decomposition): every split on a row's
+    path credits the change in class distribution to the split feature.
+    These are constant on the same grid, so they are tabulated with it.
+    """
+
+    def __init__(self, arrays, classes, max_depth, n_features, block_size=4096):
+        for name in ARRAY_NAMES + GRID_ARRAY_NAMES:
+            setattr(self, name, arrays.get(name))
+        self.classes = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.n_trees = len(self.roots)
+        self.block_size = block_size
+        # Model artifact key, set by model_cache
+        self.version = None
+        # Derived lookup tables: children[2 * node + went_right], and leaf flags
+        self._children = np.column_stack([self.left, self.right]).ravel()
+        self._is_leaf = self.left == np.arange(len(self.left))
+        self._grid = None
+        if self.grid_proba is not None:
+            self._grid = np.split(self.grid_edges, np.cumsum(self.grid_sizes - 1)[:-1])
+        # class index -> per-node path contributions, built on first use
+        self._paths = {}
+
+    @classmethod
+    def from_sklearn(cls, model, scaler):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+            own = np.arange(offset, offset + n, dtype=np.int32)
+
+            # Same normalization DecisionTreeClassifier.predict_proba applies
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, np.inf, fold_thresholds(
+                tree.threshold, scaler.mean_[feature], scaler.scale_[feature])))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int32))
+            values.append(value / normalizer)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        arrays = {
+            'feature': np.concatenate(features),
+            'threshold': np.concatenate(thresholds),
+            'left': np.concatenate(lefts),
+            'right': np.concatenate(rights),
+            'value': np.concatenate(values),
+            'roots': np.asarray(roots, dtype=np.int32)
+        }
+        forest = cls(arrays, model.classes_, max_depth, scaler.n_features_in_)
+        forest.build_grid()
+        return forest
+
+    def _split_edges(self, nodes):
+        """Sorted unique thresholds per feature among the split nodes in `nodes`"""
+        split = nodes[~self._is_leaf[nodes]]
+        return [np.unique(self.threshold[split[self.feature[split] == f]]) for f in range(self.n_features)]
+
+    @staticmethod
+    def _cell_points(edges):
+        # One representative point per cell: the cell's upper edge, or just above the last edge
+        return [np.append(e, np.nextafter(e[-1], np.inf)) if len(e) else np.zeros(1) for e in edges]
+
+    def build_grid(self, max_cells=MAX_GRID_CELLS):
+        """Tabulate the forest on the grid of all split thresholds, if it is small enough"""
+        edges = self._split_edges(np.arange(len(self.feature)))
+        sizes = np.array([len(e) + 1 for e in edges], dtype=np.int64)
+        if int(np.prod(sizes)) > max_cells:
+            return False
+        self.grid_edges = np.concatenate(edges)
+        self.grid_sizes = sizes
+        self._grid = edges
+        self.grid_proba = self._tabulate(self.value) / self.n_trees
+        if self.value.shape[1] > CONTRIBUTION_CLASS:
+            self.grid_contributions = self._tabulate(self._path_contributions(CONTRIBUTION_CLASS)) / self.n_trees
+        return True
+
+    def _tabulate(self, node_values):
+        """Sum over trees of node_values at each grid cell's leaf, shape (n_cells, k).
+
+        Each tree is evaluated only on its own (much smaller) threshold grid;
+        that table is then broadcast onto the global grid and accumulated in
+        tree order, exactly like the traversal path.
+        """
+        global_points = self._cell_points(self._grid)
+        bounds = np.append(self.roots, len(self.feature))
+        total = np.zeros(tuple(self.grid_sizes) + (node_values.shape[1],))
+        for t in range(self.n_trees):
+            tree_edges = self._split_edges(np.arange(bounds[t], bounds[t + 1]))
+            points = self._cell_points(tree_edges)
+            mesh = np.stack(np.meshgrid(*points, indexing='ij'), axis=-1).reshape(-1, self.n_features)
+            local = node_values[self.leaves(mesh, trees=[t])[0]].reshape(tuple(len(p) for p in points) + (-1,))
+            # Local cell of every global cell, per feature
+            index = [np.searchsorted(te, gp, side='left') for te, gp in zip(tree_edges, global_points)]
+            total += local[np.ix_(*index)]
+        return total.reshape(-1, node_values.shape[1])
+
+    def _grid_cells(self, X):
+        # Cell j of a feature is (edge[j-1], edge[j]], matching the trees' x <= t splits
+        cells = [np.searchsorted(edges, X[:, f], side='left') for f, edges in enumerate(self._grid)]
+        return np.ravel_multi_index(cells, self.grid_sizes)
+
+    def leaves(self, X, trees=None):
+        """Leaf node index per (tree, row) for a block of rows, shape (n_trees, n_rows)"""
+        roots = self.roots if trees is None else self.roots[trees]
+        n_rows = len(X)
+        flat_X = np.ascontiguousarray(X).ravel()
+        node = np.repeat(roots, n_rows)
+        out = node.copy()
+        # Only (tree, row) pairs that have not reached a leaf yet are stepped
+        active = np.flatnonzero(~self._is_leaf[node])
+        node = node[active]
+        offset = (active % n_rows) * self.n_features
+        while len(active):
+            went_right = flat_X[offset + self.feature[node]] > self.threshold[node]
+            node = self._children[2 * node + went_right]
+            done = self._is_leaf[node]
+            out[active[done]] = node[done]
+            if done.all():
+                break
+            keep = ~done
+            active, node, offset = active[keep], node[keep], offset[keep]
+        return out.reshape(len(roots), n_rows)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        if self.grid_proba is not None:
+            return self.grid_proba[self._grid_cells(X)]
+        return self._traverse_proba(X)
+
+    def _traverse_proba(self, X):
+        proba = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), self.block_size):
+            block = X[start:start + self.block_size]
+            node = self.leaves(block)
+            # Accumulate tree by tree, like sklearn, so results match bit for bit
+            total = np.zeros((len(block), self.value.shape[1]))
+            for t in range(self.n_trees):
+                total += self.value[node[t]]
+            proba[start:start + len(block)] = total / self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+    def _path_contributions(self, class_index):
+        """(n_nodes, n_features) sums, per feature, of the value changes from the root to each node"""
+        table = self._paths.get(class_index)
+        if table is not None:
+            return table
+        value = self.value[:, class_index]
+        table = np.zeros((len(self.feature), self.n_features))
+        # Walk all trees one depth level at a time
+        parents = self.roots[~self._is_leaf[self.roots]].astype(np.int64)
+        while len(parents):
+            rows = np.arange(len(parents))
+            for children in (self.left[parents], self.right[parents]):
+                path = table[parents]
+                path[rows, self.feature[parents]] += value[children] - value[parents]
+                table[children] = path
+            children = np.concatenate([self.left[parents], self.right[parents]])
+            parents = children[~self._is_leaf[children]].astype(np.int64)
+        self._paths[class_index] = table
+        return table
+
+    def contributions(self, X, class_index=CONTRIBUTION_CLASS):
+        """(n, 1 + n_features): base rate, then each feature's share of the class probability.
+
+        Each row sums to predict_proba(X)[:, class_index] (up to rounding).
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        out = np.empty((len(X), 1 + self.n_features))
+        out[:, 0] = self.value[self.roots, class_index].mean()
+        if self.grid_contributions is not None and self._grid is not None and class_index == CONTRIBUTION_CLASS:
+            out[:, 1:] = self.grid_contributions[self._grid_cells(X)]
+            return out
+        # Artifacts saved before grid_contributions existed take the traversal path
+        table = self._path_contributions(class_index)
+        for start in range(0, len(X), self.block_size):
+            block = X[start:start + self.block_size]
+            node = self.leaves(block)
+            total = np.zeros((len(block), self.n_features))
+            for t in range(self.n_trees):
+                total += table[node[t]]
+            out[start:start + len(block), 1:] = total / self.n_trees
+        return out
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAY_NAMES + GRID_ARRAY_NAMES:
+            if getattr(self, name) is not None:
+                np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(path, 'forest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'classes': self.classes.tolist(), 'max_depth': self.max_depth,
+                       'n_features': self.n_features}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'forest.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in ARRAY_NAMES + GRID_ARRAY_NAMES
+                  if os.path.exists(os.path.join(path, f'{name}.npy'))}
+        return cls(arrays, meta['classes'], meta['max_depth'], meta['n_features'])
+
+
+def compile_forest(model, scaler, X_check=None):
+    """Export model + scaler and verify the result against sklearn on X_check"""
+    forest = CompiledForest.from_sklearn(model, scaler)
+    if X_check is not None and len(X_check):
+        X_check = np.asarray(X_check, dtype=np.float64)
+        expected = model.predict_proba(scaler.transform(X_check))
+        for actual in (forest.predict_proba(X_check), forest._traverse_proba(X_check)):
+            if not np.allclose(actual, expected, rtol=0, atol=1e-12):
+                raise ValueError('Compiled forest does not match sklearn predict_proba')
+    return forest
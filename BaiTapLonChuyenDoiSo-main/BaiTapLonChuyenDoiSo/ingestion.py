@@ -0,0 +1,165 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+
+DEFAULT_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 10000))
+
+def detect_format(filename):
+    """'xlsx', 'xls', 'csv' or 'parquet' from the file extension"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.csv', '.txt'):
+        return 'csv'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    if ext == '.xls':
+        return 'xls'
+    return 'xlsx'
+
+
+def _iter_xlsx(file, chunk_size):
+    # openpyxl read-only mode streams rows from the sheet XML instead of
+    # building the whole workbook in memory
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            yield pd.DataFrame()
+            return
+        # Same names pandas.read_excel gives to blank header cells
+        columns = [name if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+
+        batch = []
+        yielded = False
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        wb.close()
+
+
+def _iter_csv(file, chunk_size):
+    # As text, like the xlsx reader: guessed types drop leading zeros from IDs
+    # and can differ between chunks; coerce_columns makes the features numeric
+    yield from pd.read_csv(file, chunksize=chunk_size, dtype=str)
+
+
+def _iter_parquet(file, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError('Cần cài đặt pyarrow để đọc file Parquet')
+
+    parquet_file = pq.ParquetFile(file)
+    yielded = False
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+        yielded = True
+    if not yielded:
+        yield parquet_file.schema_arrow.empty_table().to_pandas()
+
+
+def _iter_xls(file, chunk_size):
+    # Legacy .xls has no streaming reader; read once and slice
+    df = pd.read_excel(file)
+    for start in range(0, max(len(df), 1), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+READERS = {
+    'xlsx': _iter_xlsx,
+    'csv': _iter_csv,
+    'parquet': _iter_parquet,
+    'xls': _iter_xls
+}
+
+
+def iter_chunks(file, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrames of at most chunk_size rows; always yields at least one (possibly empty)"""
+    return READERS[detect_format(filename)](file, chunk_size)
+
+
+def spool_upload(file):
+    """Save an uploaded FileStorage to a temp file (keeping its extension) and return the path"""
+    suffix = os.path.splitext(file.filename or '')[1]
+    fd, path = tempfile.mkstemp(prefix='upload_', suffix=suffix)
+    with os.fdopen(fd, 'wb') as out:
+        file.save(out)
+    return path
+
+
+def discard_upload(path):
+    """Remove a spooled upload; a file already removed is not an error"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def estimate_rows(file, filename):
+    """Cheap row-count estimate for progress reporting, or None if unknown.
+
+    Reads only the sheet dimension (xlsx) or footer metadata (Parquet) and
+    rewinds the file afterwards. CSV has no header count, so returns None.
+    """
+    fmt = detect_format(filename)
+    try:
+        if fmt == 'xlsx':
+            from openpyxl import load_workbook
+            # Not closed on purpose: closing the workbook closes the upload stream
+            max_row = load_workbook(file, read_only=True).active.max_row
+            return max(max_row - 1, 0) if max_row else None
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(file).metadata.num_rows
+        return None
+    except Exception:
+        return None
+    finally:
+        file.seek(0)
+
+
+def prepare_chunk(df, actual_columns, offset):
+    """Fill missing columns and coerce features; offset is the number of rows before this chunk"""
+    actual_columns = schema.apply_defaults(df, actual_columns, offset=offset)
+    schema.coerce_columns(df, actual_columns)
+    return df, actual_columns
+
+
+def read_labeled(file, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """(X, y) features and BoHoc labels of a labeled roster; rows without a label are skipped"""
+    features, labels = [], []
+    actual_columns = None
+    offset = 0
+    for chunk in iter_chunks(file, filename, chunk_size):
+        if actual_columns is None:
+            actual_columns = schema.resolve_columns(chunk.columns)
+            missing = [key for key in ('DiemTB', 'TinChiRot', 'BoHoc') if key not in actual_columns]
+            if missing:
+                raise ValueError(f"Thiếu cột bắt buộc: {', '.join(missing)}")
+
+        chunk, chunk_columns = prepare_chunk(chunk, actual_columns, offset)
+        offset += len(chunk)
+        label = pd.to_numeric(chunk[chunk_columns['BoHoc']], errors='coerce')
+        keep = label.notna().values
+        X = schema.features(chunk, chunk_columns)
+        features.append(X[keep].astype(np.float64))
+        labels.append(label.values[keep].astype(np.int64))
+
+    if not features:
+        return np.empty((0, len(schema.FEATURES))), np.empty(0, dtype=np.int64)
+    return np.concatenate(features), np.concatenate(labels)
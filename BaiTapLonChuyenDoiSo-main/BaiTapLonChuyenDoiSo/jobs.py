@@ -0,0 +1,248 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import model_cache
+
+
+JOB_FIELDS = ('id', 'status', 'filename', 'rows', 'total', 'result_id', 'error', 'created_at', 'updated_at')
+
+# Error recorded for jobs still unfinished when their server process stops
+ABANDONED_ERROR = 'Máy chủ đã dừng trước khi công việc hoàn thành, vui lòng gửi lại file'
+
+
+class InMemoryJobBackend:
+    """Job records in a dict; finished jobs beyond max_jobs are dropped oldest first"""
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+            for job_id in [k for k, v in self._jobs.items() if v['status'] in ('done', 'failed')]:
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                del self._jobs[job_id]
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobBackend:
+    """Job records in a local SQLite file, so status survives restarts and is shared by workers"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Short-lived connection: a forked server worker must not inherit an open one
+        conn = sqlite3.connect(self.path, timeout=30)
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, status TEXT, filename TEXT, rows INTEGER, total INTEGER,
+                result_id TEXT, error TEXT, created_at REAL, updated_at REAL)''')
+        conn.close()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, job):
+        with self._connect() as conn:
+            conn.execute('INSERT INTO jobs (%s) VALUES (%s)' % (', '.join(JOB_FIELDS), ', '.join('?' * len(JOB_FIELDS))),
+                         [job.get(name) for name in JOB_FIELDS])
+
+    def update(self, job_id, **fields):
+        names = [name for name in fields if name in JOB_FIELDS and name != 'id']
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET %s WHERE id = ?' % ', '.join(f'{name} = ?' for name in names),
+                         [fields[name] for name in names] + [job_id])
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT %s FROM jobs WHERE id = ?' % ', '.join(JOB_FIELDS), (job_id,)).fetchone()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+
+def make_backend(spec):
+    """'memory' or 'sqlite:///path/to/jobs.db'"""
+    if spec and spec.startswith('sqlite:///'):
+        return SQLiteJobBackend(spec[len('sqlite:///'):])
+    return InMemoryJobBackend()
+
+
+# Model cache inside each scoring process, keyed by artifact key
+_worker_models = {}
+
+# Progress channel back to the web process, set when a pool process starts
+_progress_queue = None
+
+
+def worker_forest(model_key, artifact_dir=model_cache.DEFAULT_ARTIFACT_DIR):
+    """The compiled forest for model_key, loaded once per pool process"""
+    if model_key not in _worker_models:
+        forest = model_cache.load_forest(model_key, artifact_dir)
+        if forest is None:
+            raise RuntimeError(f'Không tìm thấy model artifact {model_key}')
+        _worker_models.clear()
+        _worker_models[model_key] = forest
+    return _worker_models[model_key]
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _worker_run(job_id, run_fn, args):
+    """Runs in a pool process: the whole job, with progress sent back to the web process"""
+    def progress(rows, total):
+        _progress_queue.put((job_id, rows, total))
+
+    return run_fn(*args, progress=progress)
+
+
+class JobQueue:
+    """Background batch scoring.
+
+    Each job (reading, scoring and saving the upload) runs entirely in a
+    process pool, so large uploads neither block a web worker nor hold its
+    GIL. A coordinator thread per job only waits for the result ID, and one
+    listener thread records the progress the pool processes report.
+    shutdown() lets a stopping server process finish or fail its jobs
+    instead of leaving them running forever.
+    """
+
+    def __init__(self, backend, max_jobs=2, max_processes=None):
+        self.backend = backend
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self._threads = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='job')
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Queued or running job ID -> its cleanup callback (or None)
+        self._unfinished = {}
+        self._idle = threading.Condition()
+
+    @property
+    def pool(self):
+        # Created on first use; 'spawn' so workers never inherit the web server's threads
+        with self._pool_lock:
+            if self._pool is None:
+                context = multiprocessing.get_context('spawn')
+                progress_queue = context.Queue()
+                self._pool = ProcessPoolExecutor(max_workers=self.max_processes, mp_context=context,
+                                                 initializer=_init_worker, initargs=(progress_queue,))
+                threading.Thread(target=self._record_progress, args=(progress_queue,),
+                                 name='job-progress', daemon=True).start()
+            return self._pool
+
+    def _record_progress(self, progress_queue):
+        while True:
+            job_id, rows, total = progress_queue.get()
+            self.backend.update(job_id, rows=rows, total=total, updated_at=time.time())
+
+    def submit(self, run_fn, filename, *args, cleanup=None):
+        """Queue run_fn(*args, progress=callback) in the process pool and return the job ID.
+
+        run_fn must be a module-level function (it is pickled by name) and
+        returns the result ID; progress(rows, total) updates the record.
+        cleanup() runs in this process if the job fails or is abandoned,
+        e.g. to remove an input file run_fn would have removed itself.
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self.backend.create({
+            'id': job_id, 'status': 'queued', 'filename': filename, 'rows': 0, 'total': None,
+            'result_id': None, 'error': None, 'created_at': now, 'updated_at': now
+        })
+        with self._idle:
+            self._unfinished[job_id] = cleanup
+        self._threads.submit(self._run, job_id, run_fn, args)
+        return job_id
+
+    def _finish(self, job_id):
+        """Take job_id off the unfinished jobs; (False, None) if shutdown() already gave up on it"""
+        with self._idle:
+            if job_id not in self._unfinished:
+                return False, None
+            cleanup = self._unfinished.pop(job_id)
+            self._idle.notify_all()
+            return True, cleanup
+
+    def _cleanup(self, job_id, cleanup):
+        if cleanup is None:
+            return
+        try:
+            cleanup()
+        except Exception as e:
+            print(f"Cleanup of job {job_id} failed: {e}")
+
+    def _run(self, job_id, run_fn, args):
+        self.backend.update(job_id, status='running', updated_at=time.time())
+        try:
+            result_id = self.pool.submit(_worker_run, job_id, run_fn, args).result()
+        except Exception as e:
+            owned, cleanup = self._finish(job_id)
+            if owned:
+                print(f"Job {job_id} failed: {e}")
+                self.backend.update(job_id, status='failed', error=str(e), updated_at=time.time())
+                self._cleanup(job_id, cleanup)
+            return
+        if self._finish(job_id)[0]:
+            self.backend.update(job_id, status='done', result_id=result_id, updated_at=time.time())
+
+    def shutdown(self, timeout=None):
+        """Wait up to timeout seconds for queued and running jobs, then fail the rest.
+
+        Jobs still unfinished are marked failed, their cleanup callbacks run
+        and the pool processes are stopped. Returns how many jobs were failed.
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: not self._unfinished, timeout)
+            abandoned = self._unfinished
+            self._unfinished = {}
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        for job_id, cleanup in abandoned.items():
+            self.backend.update(job_id, status='failed', error=ABANDONED_ERROR, updated_at=time.time())
+            self._cleanup(job_id, cleanup)
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            if abandoned:
+                # Stop the abandoned jobs' processes (terminate_workers() is Python 3.14+)
+                for process in list((getattr(pool, '_processes', None) or {}).values()):
+                    process.terminate()
+            # Waits for the processes to exit, so none outlives a stopping server worker
+            pool.shutdown(wait=True, cancel_futures=True)
+        return len(abandoned)
+
+    def get(self, job_id):
+        """Job record with a computed progress percentage, or None"""
+        job = self.backend.get(job_id)
+        if job is None:
+            return None
+        if job['status'] == 'done':
+            percent = 100.0
+        elif job['total']:
+            percent = round(min(job['rows'] / job['total'], 1) * 100, 2)
+        else:
+            percent = None
+        job['progress'] = {'rows': job.pop('rows'), 'total': job.pop('total'), 'percent': percent}
+        return job
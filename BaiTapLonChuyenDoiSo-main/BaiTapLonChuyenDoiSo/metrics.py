@@ -0,0 +1,255 @@
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Seconds; covers single predictions (~ms) up to large uploads (minutes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Per-request profiling: only when enabled, for requests sending PROFILE_HEADER
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', '0') == '1'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOP = 25
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format"""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_labels(self.labels, key, [("le", _number(bound))])} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labels, key)} {_number(total)}')
+                lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Callback:
+    """Metric read at scrape time; collect() returns {label values tuple: value}"""
+
+    def __init__(self, name, documentation, collect, labels=(), kind='gauge'):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self.collect().items()):
+            if value is not None:
+                lines.append(f'{self.name}{_labels(self.labels, key)} {_number(value)}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('app_request_duration_seconds', 'Request latency by endpoint',
+                            labels=('endpoint', 'method', 'status'))
+PHASE_SECONDS = Histogram('app_phase_duration_seconds', 'Time spent per request phase',
+                          labels=('endpoint', 'phase'))
+REQUEST_ROWS = Histogram('app_request_rows', 'Rows processed per request',
+                         labels=('endpoint',), buckets=ROW_BUCKETS)
+ROWS_TOTAL = Counter('app_rows_total', 'Rows processed', labels=('endpoint',))
+
+_metrics = [REQUEST_SECONDS, PHASE_SECONDS, REQUEST_ROWS, ROWS_TOTAL]
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """Phase durations and row count of one request"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = 0
+        self.status = 500
+        self.streaming = False
+        self.profiler = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self):
+        """Value for the Server-Timing response header"""
+        return ', '.join(f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in self.phases.items())
+
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'timings', None)
+
+
+def start_request(endpoint, profile=False):
+    timings = RequestTimings(endpoint)
+    if profile:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            timings.profiler = profiler
+        except ValueError:
+            # Another request is being profiled (one profiler at a time on Python 3.12+)
+            pass
+    _local.timings = timings
+    return timings
+
+
+def finish_request(method):
+    """Record the current request's latency, phases and rows; returns its RequestTimings.
+
+    Requests whose body is wrapped in stream() are recorded when the body ends instead.
+    """
+    timings = current()
+    if timings is None or timings.streaming:
+        return None
+    return _finish(timings, method)
+
+
+def _finish(timings, method):
+    if current() is timings:
+        _local.timings = None
+    elapsed = time.perf_counter() - timings.started
+    REQUEST_SECONDS.observe(elapsed, endpoint=timings.endpoint, method=method, status=timings.status)
+    for phase, seconds in timings.phases.items():
+        PHASE_SECONDS.observe(seconds, endpoint=timings.endpoint, phase=phase)
+    if timings.rows:
+        REQUEST_ROWS.observe(timings.rows, endpoint=timings.endpoint)
+        ROWS_TOTAL.inc(timings.rows, endpoint=timings.endpoint)
+    if timings.profiler is not None:
+        timings.profiler.disable()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            dump_profile(timings.profiler, timings.endpoint, elapsed)
+    return timings
+
+
+def stream(iterable, method):
+    """Wrap a streamed response body so the request is recorded when the body ends"""
+    timings = current()
+    if timings is None:
+        return iterable
+    timings.streaming = True
+
+    def wrapper():
+        try:
+            yield from iterable
+        finally:
+            timings.streaming = False
+            _finish(timings, method)
+    return wrapper()
+
+
+@contextmanager
+def phase(name):
+    """Time a block as one phase of the current request (no-op outside a request)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current()
+        if timings is not None:
+            timings.add(name, time.perf_counter() - start)
+
+
+def timed_iter(iterable, name):
+    """Yield from iterable, timing each step (e.g. reading the next chunk) as a phase"""
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def add_rows(count):
+    timings = current()
+    if timings is not None:
+        timings.rows += count
+
+
+def dump_profile(profiler, endpoint, elapsed):
+    """Print the hottest functions and save the full profile for snakeviz/pstats"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d_%H%M%S")}_{endpoint}_{int(elapsed * 1000)}ms.prof')
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    print(f"Profile of {endpoint} ({elapsed * 1000:.0f} ms) saved to {path}")
+    print(out.getvalue())
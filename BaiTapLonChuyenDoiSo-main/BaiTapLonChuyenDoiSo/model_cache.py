@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from importlib.metadata import PackageNotFoundError, version
+
+import numpy as np
+
+from forest_engine import CompiledForest, compile_forest
+
+
+# Bump when the artifact layout changes so old artifacts are ignored
+ARTIFACT_FORMAT = 3
+
+DEFAULT_ARTIFACT_DIR = os.environ.get('MODEL_ARTIFACT_DIR', 'model_artifacts')
+
+
+def sklearn_version():
+    """Installed scikit-learn version, or None on hosts that only serve compiled forests"""
+    try:
+        return version('scikit-learn')
+    except PackageNotFoundError:
+        return None
+
+
+def artifact_key(X, y, params):
+    """Hash of the training data and hyperparameters identifying an artifact.
+
+    The scikit-learn version is recorded in meta.json instead, so a host
+    without scikit-learn can still find and serve a compiled artifact.
+    """
+    sha = hashlib.sha256()
+    sha.update(json.dumps({
+        'format': ARTIFACT_FORMAT,
+        'params': params
+    }, sort_keys=True).encode('utf-8'))
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.ascontiguousarray(np.asarray(y).astype(str))
+    sha.update(str(X.shape).encode('utf-8'))
+    sha.update(X.tobytes())
+    sha.update('\x00'.join(y.tolist()).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def load_forest(key, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Load the compiled forest for a key (memory-mapped), or None if there is none.
+
+    This is the serving path and does not import scikit-learn.
+    """
+    path = os.path.join(artifact_dir, key, 'forest')
+    if not os.path.exists(os.path.join(path, 'forest.json')):
+        return None
+    try:
+        forest = CompiledForest.load(path)
+        forest.version = key
+        return forest
+    except Exception as e:
+        print(f"Could not load model artifact {key}: {e}")
+        return None
+
+
+def load_sklearn(key, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Load the original (model, scaler) for a key, or None; only needed for retraining"""
+    import joblib
+
+    model_file = os.path.join(artifact_dir, key, 'model.joblib')
+    if not os.path.exists(model_file):
+        return None
+    try:
+        bundle = joblib.load(model_file)
+        return bundle['model'], bundle['scaler']
+    except Exception as e:
+        print(f"Could not load model artifact {key}: {e}")
+        return None
+
+
+def save_artifact(key, model, scaler, forest, meta=None, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Write an artifact atomically so concurrent workers never see a partial one"""
+    import joblib
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    path = os.path.join(artifact_dir, key)
+    tmp_path = tempfile.mkdtemp(prefix=f'.{key}.', dir=artifact_dir)
+    try:
+        joblib.dump({'model': model, 'scaler': scaler}, os.path.join(tmp_path, 'model.joblib'))
+        forest.save(os.path.join(tmp_path, 'forest'))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(meta or {}, key=key, format=ARTIFACT_FORMAT, sklearn=sklearn_version()),
+                      f, ensure_ascii=False, indent=2)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another worker published the same artifact first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+
+def load_or_train(X, y, params, train_fn, artifact_dir=DEFAULT_ARTIFACT_DIR, force=False):
+    """Return (forest, key), training with train_fn only on a cache miss.
+
+    train_fn(X, y) returns (model, scaler, report); the report is kept in meta.json.
+    An artifact trained with another scikit-learn than the installed one is
+    retrained; without scikit-learn installed it is served as is.
+    """
+    key = artifact_key(X, y, params)
+    if not force:
+        forest = load_forest(key, artifact_dir)
+        installed = sklearn_version()
+        trained_with = (load_meta(key, artifact_dir) or {}).get('sklearn')
+        if forest is not None and installed not in (None, trained_with):
+            print(f"Model artifact {key[:12]} was trained with scikit-learn {trained_with}, retraining")
+            force = True
+        elif forest is not None:
+            print(f"Loaded model artifact {key[:12]}")
+            return forest, key
+
+    model, scaler, report = train_fn(X, y)
+    # Verified against sklearn on the training rows before it is published
+    forest = compile_forest(model, scaler, X)
+    forest.version = key
+    if force:
+        shutil.rmtree(os.path.join(artifact_dir, key), ignore_errors=True)
+    meta = {'params': params, 'n_samples': int(len(y)), 'training': report}
+    save_artifact(key, model, scaler, forest, meta, artifact_dir)
+    print(f"Trained and saved model artifact {key[:12]}")
+    return forest, key
+
+
+def load_meta(key, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """meta.json of an artifact, or None"""
+    meta_file = os.path.join(artifact_dir, key, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_or_retrain(parent_key, X_new, y_new, params, retrain_fn, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Return (forest, key) for parent_key updated with new labeled rows.
+
+    retrain_fn(model, scaler, X_new, y_new) gets the parent's sklearn model
+    and returns (model, scaler, report). The new artifact records its parent
+    and the base artifact it descends from.
+    """
+    parent_meta = load_meta(parent_key, artifact_dir)
+    loaded = load_sklearn(parent_key, artifact_dir)
+    if parent_meta is None or loaded is None:
+        raise ValueError(f'Không tìm thấy model artifact {parent_key}')
+
+    key = artifact_key(X_new, y_new, dict(params, parent=parent_key))
+    forest = load_forest(key, artifact_dir)
+    if forest is not None:
+        print(f"Loaded model artifact {key[:12]}")
+        return forest, key
+
+    model, scaler, report = retrain_fn(*loaded, X_new, y_new)
+    forest = compile_forest(model, scaler, X_new)
+    forest.version = key
+    meta = {'params': params, 'n_samples': int(len(y_new)), 'training': report,
+            'parent': parent_key, 'base': parent_meta.get('base', parent_key)}
+    save_artifact(key, model, scaler, forest, meta, artifact_dir)
+    print(f"Retrained model artifact {key[:12]} from {parent_key[:12]}")
+    return forest, key
+
+
+def publish(key, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Mark key as the version to serve; survives restarts"""
+    os.makedirs(artifact_dir, exist_ok=True)
+    tmp_file = os.path.join(artifact_dir, f'.CURRENT.{os.getpid()}')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(key)
+    os.replace(tmp_file, os.path.join(artifact_dir, 'CURRENT'))
+
+
+def current_key(artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Key last passed to publish(), or None"""
+    try:
+        with open(os.path.join(artifact_dir, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_published(base_key, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """The published retrained forest descending from base_key, or None"""
+    key = current_key(artifact_dir)
+    if not key or key == base_key:
+        return None
+    meta = load_meta(key, artifact_dir)
+    if meta is None or meta.get('base') != base_key:
+        return None
+    return load_forest(key, artifact_dir)
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from schema import FEATURES
+
+
+def normalize_features(features):
+    """(n, len(FEATURES)) float64 array; ints and floats of equal value share a cache key.
+
+    Values are not rounded: the model sees exactly what it would without the
+    cache, and rosters already repeat the same small set of values.
+    """
+    features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURES))
+    return features + 0.0  # turns -0.0 into 0.0
+
+
+class PredictionCache:
+    """Bounded LRU of model output rows keyed on the (DiemTB, TinChiRot, SoMonHocLai) triple.
+
+    Holds predict_proba rows, or any other per-row output such as feature
+    contributions. Batches are deduplicated before scoring: only unique rows
+    that miss the cache reach the model, and the results are scattered back
+    to every row. The whole cache is dropped when the model version changes.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rows = 0
+        self.unique_rows = 0
+
+    def lookup(self, features, version, compute_fn):
+        """compute_fn's output for every row, calling compute_fn(unique_missing_rows) at most once"""
+        features = normalize_features(features)
+        if len(features) == 0:
+            return compute_fn(features)
+        uniques, inverse = np.unique(features, axis=0, return_inverse=True)
+        keys = [tuple(row) for row in uniques.tolist()]
+
+        cached = [None] * len(keys)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            for i, key in enumerate(keys):
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    cached[i] = value
+            missing = [i for i, value in enumerate(cached) if value is None]
+            self.rows += len(features)
+            self.unique_rows += len(keys)
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = np.asarray(compute_fn(uniques[missing]), dtype=np.float64)
+            with self._lock:
+                for i, row in zip(missing, computed.tolist()):
+                    cached[i] = tuple(row)
+                    if version == self._version:
+                        self._entries[keys[i]] = cached[i]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return np.array(cached, dtype=np.float64)[inverse.reshape(-1)]
+
+    # Probabilities for every row
+    predict_proba = lookup
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'model_version': self._version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'rows': self.rows,
+                'unique_rows': self.unique_rows,
+                'dedup_ratio': round(1 - self.unique_rows / self.rows, 4) if self.rows else None
+            }
@@ -0,0 +1,64 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Server-side store for batch prediction results.
+
+    Results are kept as DataFrames under a random ID so /chart_data,
+    /export_chart_data and /download_excel only need the ID instead of the
+    whole dataset. Entries expire after ``ttl_seconds`` and the least
+    recently used ones are evicted once ``max_entries`` or ``max_bytes``
+    is exceeded.
+    """
+
+    def __init__(self, max_entries=32, ttl_seconds=3600, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # id -> (frame, expires_at, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, frame, result_id=None):
+        """Store a results DataFrame (under a new random ID unless given) and return its ID"""
+        result_id = result_id or uuid.uuid4().hex
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if result_id in self._entries:
+                self._remove(result_id)
+            self._entries[result_id] = (frame, time.monotonic() + self.ttl_seconds, size)
+            self._total_bytes += size
+            self._evict()
+        return result_id
+
+    def get(self, result_id):
+        """Return the stored DataFrame, or None if unknown or expired"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                self._remove(result_id)
+                return None
+            self._entries.move_to_end(result_id)
+            return entry[0]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, result_id):
+        _, _, size = self._entries.pop(result_id)
+        self._total_bytes -= size
+
+    def _evict(self):
+        now = time.monotonic()
+        for result_id in [k for k, (_, expires_at, _) in self._entries.items() if expires_at < now]:
+            self._remove(result_id)
+        # Always keep the newest entry, even if it alone exceeds the memory cap
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                          or self._total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
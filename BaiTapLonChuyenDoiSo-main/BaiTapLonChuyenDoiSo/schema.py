@@ -0,0 +1,129 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# Accepted headers per logical column, in order of preference.
+# Matching ignores case, accents, whitespace and underscores, so
+# 'Điểm TB', 'diem_tb' and 'DIEM TB' are all the same header.
+COLUMN_ALIASES = {
+    'MaSV': ['MaSv', 'MaSV', 'ma_sv', 'MSSV', 'StudentID', 'Mã sinh viên'], # Đã ưu tiên 'MaSv'
+    'HoTen': ['HoTen', 'ho_ten', 'Name', 'Họ tên', 'FullName', 'Họ và tên'],
+    'Lop': ['Lop', 'lop', 'Class', 'Lớp', 'ClassName'],
+    'Khoa': ['Khoa', 'khoa', 'Faculty', 'Department'],
+    'DiemTB': ['DiemTB', 'diem_tb', 'AverageScore', 'Score', 'Điểm TB', 'Điểm trung bình'],
+    'TinChiRot': ['TinChiRot', 'tin_chi_rot', 'FailedCredits', 'Tín chỉ rớt', 'SoTinChiRot', 'Số tín chỉ rớt'],
+    'SoMonHocLai': ['SoMonHocLai', 'so_mon_hoc_lai', 'FailedSubjects', 'Số môn học lại', 'MonHocLai', 'Số môn rớt'],
+    'BoHoc': ['BoHoc', 'bo_hoc', 'Dropout', 'Bỏ học']
+}
+
+# Model input columns, in feature order
+FEATURES = ('DiemTB', 'TinChiRot', 'SoMonHocLai')
+
+# Value used when a column is missing; '{}' is replaced by the 1-based row number
+DEFAULTS = {
+    'SoMonHocLai': 0,
+    'MaSV': 'SV{:03d}',
+    'HoTen': 'Sinh viên {}',
+    'Lop': 'Unknown Class'
+}
+
+# Columns defaulted when reading the student roster (dulieu1.xlsx) for training and lookups
+ROSTER_DEFAULTS = ('SoMonHocLai', 'MaSV', 'HoTen')
+
+MISSING_MESSAGES = {
+    'SoMonHocLai': "SoMonHocLai column not found, using default values...",
+    'MaSV': "MaSV/MaSv column not found, using default values...",
+    'HoTen': "HoTen column not found, using default values...",
+    'Lop': "Lop column not found in uploaded file, using default value 'Unknown Class'."
+}
+
+_SEPARATORS = re.compile(r'[\s_]+')
+
+
+def normalize_header(name):
+    """'  Điểm  TB ' -> 'diemtb': lower case, no accents, no whitespace or underscores"""
+    text = unicodedata.normalize('NFKD', str(name).replace('Đ', 'D').replace('đ', 'd'))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _SEPARATORS.sub('', text).lower()
+
+
+@lru_cache(maxsize=256)
+def _resolve(headers, keys):
+    by_normalized = {}
+    for header in headers:
+        by_normalized.setdefault(normalize_header(header), header)
+
+    actual_columns = {}
+    for key in keys:
+        for alias in COLUMN_ALIASES[key]:
+            # An exact header wins over one that only matches after normalizing
+            if alias in headers:
+                actual_columns[key] = alias
+                break
+            header = by_normalized.get(normalize_header(alias))
+            if header is not None:
+                actual_columns[key] = header
+                break
+    return actual_columns
+
+
+def resolve_columns(columns, keys=tuple(COLUMN_ALIASES)):
+    """Map logical column names to the headers present; memoized per header signature"""
+    return dict(_resolve(tuple(columns), tuple(keys)))
+
+
+def default_values(key, row_numbers):
+    """Default column for the given 1-based row numbers, built without a Python loop"""
+    default = DEFAULTS[key]
+    if not isinstance(default, str) or '{' not in default:
+        return default
+    prefix, _, rest = default.partition('{')
+    spec, _, suffix = rest.partition('}')
+    numbers = np.asarray(row_numbers).astype(str)
+    width = re.fullmatch(r':0(\d+)d', spec)
+    if width:
+        numbers = np.char.zfill(numbers, int(width.group(1)))
+    return np.char.add(np.char.add(prefix, numbers), suffix).astype(object)
+
+
+def apply_defaults(df, actual_columns, keys=tuple(DEFAULTS), offset=0):
+    """Add default columns for the missing keys; returns the completed mapping.
+
+    offset is the number of rows before df (for chunked reads), so generated
+    IDs and names continue across chunks.
+    """
+    actual_columns = dict(actual_columns)
+    row_numbers = None
+    for key in keys:
+        if key in actual_columns:
+            continue
+        if row_numbers is None:
+            row_numbers = np.arange(offset + 1, offset + len(df) + 1)
+        df[key] = default_values(key, row_numbers)
+        actual_columns[key] = key
+    return actual_columns
+
+
+def coerce_columns(df, actual_columns):
+    """Numeric features (invalid or empty -> 0) and stripped string student IDs"""
+    if 'MaSV' in actual_columns:
+        df[actual_columns['MaSV']] = df[actual_columns['MaSV']].astype(str).str.strip()
+    for key in FEATURES:
+        if key in actual_columns:
+            df[actual_columns[key]] = pd.to_numeric(df[actual_columns[key]], errors='coerce').fillna(0)
+
+
+def report_missing(actual_columns, keys=tuple(MISSING_MESSAGES)):
+    """Log which columns will be filled with defaults"""
+    for key in keys:
+        if key not in actual_columns:
+            print(MISSING_MESSAGES[key])
+
+
+def features(df, actual_columns):
+    """(n, len(FEATURES)) feature matrix in model order"""
+    return df[[actual_columns[key] for key in FEATURES]].values
@@ -0,0 +1,268 @@
+"""Multi-process server: the model is loaded once and shared by all workers.
+
+The master process loads (or trains) the compiled forest and the student
+roster, opens the listening socket and forks the workers, so every worker
+sees the same forest arrays copy-on-write (they are read-only, and
+memory-mapped from the artifact when loaded from disk) instead of holding
+its own copy. When a new model is published (/retrain in any worker, or the
+`flask retrain` command) the master loads it once and replaces the workers
+generation by generation; old workers finish their in-flight requests
+and background jobs first. SIGHUP does the same rolling restart on demand.
+
+Usage: python serve.py [--workers N] [--host 0.0.0.0] [--port 8000] [--data dulieu1.xlsx]
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+# Job records and result IDs must be visible to every worker as soon as they are
+# returned, not just to the one that created them
+os.environ.setdefault('JOB_STORE', 'sqlite:///jobs.db')
+os.environ.setdefault('COHORT_WRITE_BEHIND', '0')
+
+import numpy as np  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+from werkzeug.wsgi import ClosingIterator  # noqa: E402
+
+import app  # noqa: E402
+import model_cache  # noqa: E402
+
+# Seconds a stopping worker waits for in-flight requests
+GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+# Seconds it then waits for its queued and running /jobs before failing them
+JOB_TIMEOUT = float(os.environ.get('SERVE_JOB_TIMEOUT', 300))
+# How often the master checks model_artifacts/CURRENT for a newly published model
+RELOAD_POLL_SECONDS = float(os.environ.get('SERVE_RELOAD_POLL', 1))
+
+
+class InFlight:
+    """WSGI middleware counting requests in progress, including streamed bodies"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.count = 0
+        self.idle = threading.Event()
+        self.idle.set()
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.count += 1
+            self.idle.clear()
+
+    def _exit(self):
+        with self._lock:
+            self.count -= 1
+            if self.count == 0:
+                self.idle.set()
+
+    def __call__(self, environ, start_response):
+        self._enter()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._exit()
+            raise
+        # The server closes the body once it is fully sent
+        return ClosingIterator(body, self._exit)
+
+
+def run_worker(listener, host, port):
+    """Serve requests on the inherited socket until SIGTERM, then drain requests and jobs and return"""
+    in_flight = InFlight(app.app)
+    server = make_server(host, port, in_flight, threaded=True, fd=listener.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    # Ctrl-C and reloads are handled by the master
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    print(f"Worker {os.getpid()} serving model {app.forest.version[:12]}")
+    server.serve_forever()
+    if not in_flight.idle.wait(GRACEFUL_TIMEOUT):
+        print(f"Worker {os.getpid()} stopping with {in_flight.count} requests still running")
+    server.server_close()
+    # Job coordinators are threads of this process and would die with it
+    abandoned = app.job_queue.shutdown(JOB_TIMEOUT)
+    if abandoned:
+        print(f"Worker {os.getpid()} stopping with {abandoned} jobs unfinished, marked failed")
+
+
+class Master:
+    """Forks and supervises the workers and rolls them over to new models"""
+
+    def __init__(self, listener, host, port, workers):
+        self.listener = listener
+        self.host = host
+        self.port = port
+        self.n_workers = workers
+        self.workers = {}  # pid -> model version it was forked with
+        self.retiring = set()
+        self.stopping = False
+        self.restart_requested = False
+        # Retrained models are only picked up on top of the base model the master loaded
+        self.base = (model_cache.load_meta(app.forest.version) or {}).get('base', app.forest.version)
+        self.skipped_key = None
+
+    def spawn(self):
+        # Otherwise each worker inherits and re-prints the master's buffered output
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.listener, self.host, self.port)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.workers[pid] = app.forest.version
+
+    def reap(self):
+        """Collect exited workers; replace the ones that were not asked to stop"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.discard(pid)
+            if self.workers.pop(pid, None) is not None and not self.stopping:
+                print(f"Worker {pid} exited unexpectedly (status {status}), starting a new one")
+                time.sleep(0.5)
+                self.spawn()
+
+    def published_forest(self):
+        """The newly published forest, or None if the served one is current"""
+        key = model_cache.current_key()
+        if not key or key in (app.forest.version, self.skipped_key):
+            return None
+        forest = model_cache.resolve_published(self.base)
+        if forest is None:
+            # Unloadable, or retrained from another base model: do not retry every poll
+            print(f"Published model {key[:12]} not loaded, keeping {app.forest.version[:12]}")
+            self.skipped_key = key
+        return forest
+
+    def roll(self, forest=None):
+        """Start a new generation of workers (on forest, if given), then retire the old one"""
+        if forest is not None:
+            warm(forest)
+            app.forest = forest
+            print(f"Reloading workers with model {forest.version[:12]}")
+        old = list(self.workers)
+        for _ in range(self.n_workers):
+            self.spawn()
+        for pid in old:
+            self.workers.pop(pid, None)
+            self.retiring.add(pid)
+            os.kill(pid, signal.SIGTERM)
+
+    def run(self):
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_restart(signum, frame):
+            self.restart_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_restart)
+
+        for _ in range(self.n_workers):
+            self.spawn()
+        print(f"Serving on http://{self.host}:{self.port} with {self.n_workers} workers (master {os.getpid()})")
+
+        while not self.stopping:
+            time.sleep(RELOAD_POLL_SECONDS)
+            self.reap()
+            if self.stopping:
+                break
+            forest = self.published_forest()
+            if forest is not None or self.restart_requested:
+                self.restart_requested = False
+                self.roll(forest)
+
+        self.shutdown()
+
+    def shutdown(self):
+        pids = list(self.workers) + list(self.retiring)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + JOB_TIMEOUT + 5
+        for pid in pids:
+            while time.monotonic() < deadline:
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        break
+                except ChildProcessError:
+                    break
+                time.sleep(0.1)
+            else:
+                os.kill(pid, signal.SIGKILL)
+        self.listener.close()
+        print("Server stopped")
+
+
+def warm(forest):
+    """Page in the forest arrays and build its lazy tables, so workers fork with them shared"""
+    row = np.zeros((1, forest.n_features))
+    forest.predict_proba(row)
+    forest.contributions(row)
+
+
+def preload(data_file):
+    """Load everything shared by the workers in the master, before forking"""
+    app.load_and_train_model(data_file)
+    warm(app.forest)
+    try:
+        app.student_store.refresh()
+    except OSError as e:
+        print(f"Student roster not loaded: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS', 0)) or os.cpu_count() or 1)
+    parser.add_argument('--host', default=os.environ.get('SERVE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SERVE_PORT', 8000)))
+    parser.add_argument('--data', default='dulieu1.xlsx', help='Roster the model is trained on')
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+
+    if 'JOB_PROCESSES' not in os.environ and hasattr(os, 'fork'):
+        # Every worker starts its own job pool on first use; share the cores between them
+        app.job_queue.max_processes = max(1, (os.cpu_count() or 1) // args.workers)
+
+    preload(args.data)
+
+    if not hasattr(os, 'fork'):
+        # Windows has no fork(): one process, one thread per request
+        print(f"Serving on http://{args.host}:{args.port} (single process, no fork() on this platform)")
+        make_server(args.host, args.port, app.app, threaded=True).serve_forever()
+        return
+
+    family = socket.AF_INET6 if ':' in args.host else socket.AF_INET
+    listener = socket.create_server((args.host, args.port), family=family, backlog=128)
+    listener.set_inheritable(True)
+    Master(listener, args.host, args.port, args.workers).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const statisticsElement = document.getElementById('statistics');
     const resultsTableDiv = document.getElementById('resultsTable');
     const chartSection = document.getElementById('chartSection');
-    let allResultsData = [];
+    let allResultsData = null;
+    let currentResultId = null;
     let currentDisplayLimit = 10;
     const increment = 5;
     let dropoutChart = null;
@@ -55,32 +56,95 @@ document.addEventListener('DOMContentLoaded', () => {
         formData.append('file', fileInput.files[0]);
         
         try {
-            const response = await fetch('/upload_predict', {
+            // Stream the results: one NDJSON line per scored chunk
+            const response = await fetch('/upload_predict?format=ndjson', {
                 method: 'POST',
                 body: formData
             });
             
-            const result = await response.json();
-            
-            if (result.error) {
+            if (!(response.headers.get('Content-Type') || '').includes('ndjson')) {
+                const result = await response.json();
                 uploadResultDiv.innerHTML = `<p class="error">Lỗi: ${result.error}</p>`;
-            } else {
-                displayResults(result.results);
+                return;
             }
+            
+            const data = { format: 'columnar', result_id: null, length: 0, columns: {} };
+            currentDisplayLimit = 10;
+            uploadResultDiv.innerHTML = '';
+            await readNdjson(response, message => {
+                if (message.type === 'chunk') {
+                    appendColumns(data, message);
+                    const percent = message.progress.percent !== null ? ` (${message.progress.percent}%)` : '';
+                    uploadResultDiv.innerHTML = `<p>Đang xử lý: ${message.progress.rows} sinh viên${percent}...</p>`;
+                    displayResults(data, false);
+                } else if (message.type === 'done') {
+                    data.result_id = message.result_id;
+                    uploadResultDiv.innerHTML = '';
+                    displayResults(data);
+                } else if (message.type === 'error') {
+                    uploadResultDiv.innerHTML = `<p class="error">Lỗi: ${message.error}</p>`;
+                }
+            });
         } catch (error) {
             uploadResultDiv.innerHTML = `<p class="error">Lỗi kết nối: ${error.message}</p>`;
         }
     });
 
-    // Helper function to display results
-    function displayResults(results) {
+    // Read an NDJSON response line by line as it arrives
+    async function readNdjson(response, onMessage) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+        }
+        if (buffered.trim()) onMessage(JSON.parse(buffered));
+    }
+
+    // Append a streamed chunk's columns to the accumulated columnar results
+    function appendColumns(data, chunk) {
+        Object.keys(chunk.columns).forEach(name => {
+            const target = data.columns[name] || (data.columns[name] = []);
+            const values = chunk.columns[name];
+            for (let i = 0; i < values.length; i++) target.push(values[i]);
+        });
+        data.length += chunk.length;
+    }
+
+    // Build row objects for [start, end) from a columnar payload
+    function rowsFromColumns(data, start = 0, end = data.length) {
+        const names = Object.keys(data.columns);
+        const rows = [];
+        for (let i = start; i < Math.min(end, data.length); i++) {
+            const row = {};
+            names.forEach(name => { row[name] = data.columns[name][i]; });
+            rows.push(row);
+        }
+        return rows;
+    }
+
+    // Helper function to display results (columnar payload from /upload_predict).
+    // While rows are still streaming in, the chart is left for the final call.
+    function displayResults(results, complete = true) {
         allResultsData = results;
-        currentDisplayLimit = 10;
+        currentResultId = results.result_id;
         
-        // Calculate and update statistics
+        // Calculate and update statistics straight from the column arrays
         const totalStudents = results.length;
-        const averageScore = results.reduce((sum, student) => sum + parseFloat(student.DiemTB || 0), 0) / totalStudents;
-        const dropoutCount = results.filter(student => student.prediction === 1).length;
+        const scores = results.columns.DiemTB;
+        const predictions = results.columns.prediction;
+        let scoreSum = 0;
+        let dropoutCount = 0;
+        for (let i = 0; i < totalStudents; i++) {
+            scoreSum += scores[i] || 0;
+            if (predictions[i] === 1) dropoutCount++;
+        }
+        const averageScore = totalStudents > 0 ? scoreSum / totalStudents : 0;
         const dropoutRate = ((totalStudents > 0) ? (dropoutCount / totalStudents) * 100 : 0).toFixed(2);
 
         // Show and update statistics section
@@ -91,15 +155,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Display results table and update the chart
         renderResults(results);
-        chartSection.style.display = 'block';
-        updateDropoutChart(results);
+        if (complete) {
+            chartSection.style.display = 'block';
+            updateDropoutChart(results);
+        }
     }
 
     // Helper function to display results
     function renderResults(results) {
         let html = '<table class="table table-striped table-hover"><thead><tr><th>STT</th><th>Mã SV</th><th>Họ Tên</th><th>Lớp</th><th>Điểm TB</th><th>Dự đoán</th><th>Xác suất</th><th>Chi tiết</th></tr></thead><tbody>';
 
-        const displayResults = results.slice(0, currentDisplayLimit);
+        const displayResults = rowsFromColumns(results, 0, currentDisplayLimit);
 
         displayResults.forEach(result => {
             html += `
@@ -138,14 +204,22 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Helper function to update the chart
     function updateDropoutChart(results) {
-        // Step 1: Group and count students by class
-        const uniqueClasses = [...new Set(results.map(student => student.lop))].sort();
+        // Step 1: Group and count students by class in one pass over the columns
+        const classes = results.columns.lop;
+        const predictions = results.columns.prediction;
+        const counts = new Map();
+        for (let i = 0; i < results.length; i++) {
+            const entry = counts.get(classes[i]) || { total: 0, dropout: 0 };
+            entry.total++;
+            if (predictions[i] === 1) entry.dropout++;
+            counts.set(classes[i], entry);
+        }
+        const uniqueClasses = [...counts.keys()].sort();
         
         // Step 2: Calculate dropout rate for each class
         const chartData = uniqueClasses.map(className => {
-            const studentsInClass = results.filter(student => student.lop === className);
-            const dropoutCount = studentsInClass.filter(student => student.prediction === 1).length;
-            const dropoutRate = (studentsInClass.length > 0) ? (dropoutCount / studentsInClass.length * 100).toFixed(2) : 0;
+            const { total, dropout } = counts.get(className);
+            const dropoutRate = (total > 0) ? (dropout / total * 100).toFixed(2) : 0;
             
             return {
                 className,
@@ -223,6 +297,30 @@ document.addEventListener('DOMContentLoaded', () => {
         loadStudentDetail(masv);
     };
 
+    // Tỷ lệ bỏ học = tỷ lệ chung + phần đóng góp của từng chỉ số (điểm phần trăm)
+    const CONTRIBUTION_LABELS = {
+        base: 'Tỷ lệ chung của mô hình',
+        DiemTB: 'Điểm trung bình',
+        TinChiRot: 'Số tín chỉ rớt',
+        SoMonHocLai: 'Số môn học lại'
+    };
+
+    function contributionTable(contributions) {
+        const rows = Object.keys(CONTRIBUTION_LABELS)
+            .filter(key => key in contributions)
+            .map(key => {
+                const value = contributions[key];
+                const text = key === 'base' ? `${value.toFixed(2)}%` : `${value >= 0 ? '+' : ''}${value.toFixed(2)}%`;
+                const cls = key === 'base' ? '' : (value > 0 ? 'text-danger' : 'text-success');
+                return `<tr><td>${CONTRIBUTION_LABELS[key]}</td><td class="${cls}">${text}</td></tr>`;
+            })
+            .join('');
+        return `<table class="table table-sm">
+                    <thead><tr><th>Yếu tố</th><th>Ảnh hưởng đến tỷ lệ bỏ học</th></tr></thead>
+                    <tbody>${rows}</tbody>
+                </table>`;
+    }
+
     // Load student detail content via AJAX
     async function loadStudentDetail(masv) {
         try {
@@ -256,6 +354,13 @@ document.addEventListener('DOMContentLoaded', () => {
                         </table>
                     </div>
                 </div>
+                ${student.contributions ? `
+                <div class="row mt-3">
+                    <div class="col-12">
+                        <h6>Yếu Tố Ảnh Hưởng</h6>
+                        ${contributionTable(student.contributions)}
+                    </div>
+                </div>` : ''}
                 <div class="row mt-3">
                     <div class="col-12">
                         <h6>Thông Tin Đầy Đủ</h6>
@@ -266,7 +371,7 @@ document.addEventListener('DOMContentLoaded', () => {
                                 </thead>
                                 <tbody>
                                     ${Object.keys(student)
-                                        .filter(key => key !== 'prediction' && key !== 'dropout_probability')
+                                        .filter(key => key !== 'prediction' && key !== 'dropout_probability' && key !== 'contributions')
                                         .sort()
                                         .map(key => {
                                             const value = student[key];
@@ -308,20 +413,21 @@ document.addEventListener('DOMContentLoaded', () => {
         renderResults(allResultsData);
     };
 
-    // Download Excel functionality
-    window.downloadExcel = async function() {
+    // Download Excel functionality (format: 'xlsx', 'csv' or 'parquet')
+    window.downloadExcel = async function(format = 'xlsx') {
         if (!allResultsData || allResultsData.length === 0) {
             alert('Không có dữ liệu để xuất Excel!');
             return;
         }
 
         try {
-            const response = await fetch('/download_excel', {
+            const response = await fetch(`/download_excel?format=${format}`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ results: allResultsData })
+                // The server keeps the results; only the ID goes over the wire
+                body: JSON.stringify({ result_id: currentResultId })
             });
 
             if (!response.ok) {
@@ -334,7 +440,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
-            a.download = `ket_qua_du_doan_${new Date().toISOString().slice(0, 19).replace(/[-:]/g, '').replace('T', '_')}.xlsx`;
+            a.download = `ket_qua_du_doan_${new Date().toISOString().slice(0, 19).replace(/[-:]/g, '').replace('T', '_')}.${format}`;
             document.body.appendChild(a);
             a.click();
             window.URL.revokeObjectURL(url);
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+import schema
+
+
+def normalize_masv(value):
+    """Normalize a student ID so lookups match regardless of whitespace"""
+    return str(value).strip()
+
+
+def _file_hash(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class StudentStore:
+    """In-memory student roster indexed by MaSV.
+
+    The Excel file is parsed once and kept in memory together with a dict
+    from normalized MaSV to row position. The file is only re-read when its
+    mtime changes *and* its content hash differs from the loaded copy.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # (df, actual_columns, index) is swapped as one tuple so readers never
+        # see a new DataFrame with a stale index
+        self._snapshot = (None, {}, {})
+        self._mtime = None
+        self._hash = None
+        self._lock = threading.Lock()
+
+    def _load(self, mtime, content_hash):
+        df = pd.read_excel(self.filename)
+
+        # Resolve columns, fill defaults and coerce the features once per load
+        actual_columns = schema.resolve_columns(df.columns)
+        actual_columns = schema.apply_defaults(df, actual_columns, keys=schema.ROSTER_DEFAULTS)
+        schema.coerce_columns(df, actual_columns)
+
+        # Build hash index; keep the first row for duplicated IDs like the old scan did
+        index = {}
+        for pos, masv in enumerate(df[actual_columns['MaSV']]):
+            index.setdefault(masv, pos)
+
+        self._snapshot = (df, actual_columns, index)
+        self._mtime = mtime
+        self._hash = content_hash
+        print(f"Loaded {len(df)} students from {self.filename}")
+
+    def refresh(self):
+        """Reload the roster if the file on disk has changed"""
+        mtime = os.stat(self.filename).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            content_hash = _file_hash(self.filename)
+            if content_hash == self._hash:
+                # Touched but not modified
+                self._mtime = mtime
+                return
+            self._load(mtime, content_hash)
+
+    def get(self, masv):
+        """Return (row, actual_columns) for a student, or (None, columns) if not found"""
+        self.refresh()
+        df, actual_columns, index = self._snapshot
+        pos = index.get(normalize_masv(masv))
+        if pos is None:
+            return None, actual_columns
+        return df.iloc[pos], actual_columns
+
+    def __len__(self):
+        self.refresh()
+        return len(self._snapshot[2])
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+import aggregation
+
+
+def legacy_score_ranges(scores):
+    """The loop /chart_data used before aggregation.score_distribution"""
+    score_ranges = {'0-2': 0, '2-4': 0, '4-6': 0, '6-8': 0, '8-10': 0}
+    for score in scores:
+        if score <= 2:
+            score_ranges['0-2'] += 1
+        elif score <= 4:
+            score_ranges['2-4'] += 1
+        elif score <= 6:
+            score_ranges['4-6'] += 1
+        elif score <= 8:
+            score_ranges['6-8'] += 1
+        else:
+            score_ranges['8-10'] += 1
+    return score_ranges
+
+
+def test_score_distribution_matches_legacy_loop_at_edges():
+    edges = np.array(aggregation.DEFAULT_SCORE_EDGES, dtype=np.float64)
+    scores = np.concatenate([
+        edges,
+        np.nextafter(edges, -np.inf),
+        np.nextafter(edges, np.inf),
+        [-1.0, 1.0, 3.0, 5.0, 7.0, 9.0, 10.5, 100.0]
+    ])
+    rng = np.random.default_rng(5)
+    scores = np.concatenate([scores, np.round(rng.uniform(0, 10, 1000), 2)])
+    assert aggregation.score_distribution(scores) == legacy_score_ranges(scores.tolist())
+
+
+def test_chart_series_matches_legacy_loops():
+    rng = np.random.default_rng(7)
+    n = 500
+    frame = pd.DataFrame({
+        'lop': rng.choice(['CNTT 01', 'CNTT 02', 'KT 01'], n),
+        'DiemTB': rng.choice([0, 2, 4, 6, 8, 10, 5.5, 7.25], n),
+        'tin_chi_rot': rng.integers(0, 6, n),
+        'prediction': rng.integers(0, 2, n)
+    })
+    records = frame.to_dict('records')
+
+    class_data = {}
+    for student in records:
+        data = class_data.setdefault(student['lop'], {'total': 0, 'dropout': 0})
+        data['total'] += 1
+        data['dropout'] += student['prediction'] == 1
+    failed_credits = {}
+    for student in records:
+        failed_credits[student['tin_chi_rot']] = failed_credits.get(student['tin_chi_rot'], 0) + 1
+
+    series = aggregation.chart_series(frame)
+    assert series['class_data'] == [
+        {
+            'class': lop,
+            'total_students': data['total'],
+            'dropout_count': data['dropout'],
+            'dropout_rate': round(data['dropout'] / data['total'] * 100, 2)
+        }
+        for lop, data in class_data.items()
+    ]
+    assert series['score_distribution'] == legacy_score_ranges(frame['DiemTB'].tolist())
+    assert series['failed_credits_distribution'] == failed_credits
+    assert series['overall_stats']['dropout_count'] == int(frame['prediction'].sum())
+
+
+def test_custom_edges():
+    counts = aggregation.score_distribution([0, 5, 5.01, 10], edges=(0, 5, 10))
+    assert counts == {'0-5': 2, '5-10': 2}
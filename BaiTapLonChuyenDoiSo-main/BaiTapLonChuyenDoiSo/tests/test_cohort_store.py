@@ -0,0 +1,99 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohort_store import CohortStore
+
+
+def make_results(n=237, seed=0):
+    rng = np.random.default_rng(seed)
+    # Few distinct probabilities, so most pages end inside a run of ties
+    probability = rng.choice([2.0, 35.5, 50.0, 61.0, 96.0], n)
+    return pd.DataFrame({
+        'stt': np.arange(1, n + 1),
+        'masv': [f'SV{i:04d}' for i in range(n)],
+        'hoten': [f'Sinh viên {i}' for i in range(n)],
+        'lop': rng.choice(['L1', 'L2'], n),
+        'DiemTB': rng.uniform(0, 10, n).round(2),
+        'tin_chi_rot': rng.integers(0, 10, n),
+        'so_mon_hoc_lai': rng.integers(0, 5, n),
+        'prediction': (probability >= 50).astype(int),
+        'dropout_probability': probability,
+        'contrib_base': 48.0,
+        'contrib_DiemTB': rng.normal(0, 10, n),
+        'contrib_TinChiRot': rng.normal(0, 10, n),
+        'contrib_SoMonHocLai': rng.normal(0, 10, n)
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CohortStore(str(tmp_path / 'cohorts.db'), write_behind=False)
+    store.put('c1', make_results(), filename='roster.xlsx')
+    return store
+
+
+def test_frame_round_trip(store):
+    expected = make_results()
+    frame = store.frame('c1')
+    assert list(frame.columns) == [name for name in expected.columns]
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False)
+    assert store.frame('missing') is None
+
+
+def test_cohort_summary(store):
+    summary = store.cohort('c1')
+    expected = make_results()
+    assert summary['rows'] == len(expected)
+    assert summary['at_risk'] == int(expected['prediction'].sum())
+    assert summary['filename'] == 'roster.xlsx'
+
+
+def test_failed_write_raises(store):
+    # Synchronous writes report failures, e.g. a cohort ID that is already stored
+    with pytest.raises(sqlite3.IntegrityError):
+        store.put('c1', make_results(), filename='again.xlsx')
+    assert store.cohort('c1')['filename'] == 'roster.xlsx'
+
+
+def test_query_filters(store):
+    expected = make_results()
+    expected = expected[(expected['lop'] == 'L2') & (expected['dropout_probability'] >= 50)]
+    rows, cursor = store.query('c1', lop='L2', min_probability=50, limit=1000)
+    assert cursor is None
+    assert sorted(row['stt'] for row in rows) == sorted(expected['stt'].tolist())
+
+
+def test_query_rejects_bad_arguments(store):
+    with pytest.raises(ValueError):
+        store.query('c1', sort='name')
+    with pytest.raises(ValueError):
+        store.query('c1', cursor='not-a-cursor')
+
+
+def page_through(store, **kwargs):
+    rows, cursor = store.query('c1', limit=10, **kwargs)
+    while cursor:
+        page, cursor = store.query('c1', limit=10, cursor=cursor, **kwargs)
+        rows.extend(page)
+    return rows
+
+
+@pytest.mark.parametrize('sort', ['risk', 'risk_asc'])
+def test_pagination_returns_every_row_once(store, sort):
+    rows = page_through(store, sort=sort)
+    assert sorted(row['stt'] for row in rows) == list(range(1, 238))
+    keys = [(row['dropout_probability'], row['stt']) for row in rows]
+    if sort == 'risk':
+        assert keys == sorted(keys, key=lambda k: (-k[0], k[1]))
+    else:
+        assert keys == sorted(keys, key=lambda k: (k[0], -k[1]))
+
+
+def test_pagination_with_filter(store):
+    expected = make_results()
+    expected = expected[expected['lop'] == 'L2']
+    rows = page_through(store, lop='L2')
+    assert sorted(row['stt'] for row in rows) == sorted(expected['stt'].tolist())
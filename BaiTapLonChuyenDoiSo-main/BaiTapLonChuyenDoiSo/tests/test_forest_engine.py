@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from forest_engine import CompiledForest, compile_forest
+
+
+def make_model(n_classes=2, n=400, seed=0, **params):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.uniform(0, 10, n), rng.integers(0, 10, n), rng.integers(0, 5, n)]).astype(float)
+    risk = X[:, 1] + 2 * X[:, 2] - X[:, 0] + rng.normal(0, 2, n)
+    y = np.digitize(risk, np.quantile(risk, np.linspace(0, 1, n_classes + 1)[1:-1]))
+    scaler = StandardScaler()
+    model = RandomForestClassifier(n_estimators=25, random_state=seed, **params)
+    model.fit(scaler.fit_transform(X), y)
+    return model, scaler, X
+
+
+def sample_points(forest, X, n=2000, seed=1):
+    """Random points inside and far outside the training range, plus every split threshold and its neighbours"""
+    rng = np.random.default_rng(seed)
+    low, high = X.min(axis=0), X.max(axis=0)
+    span = high - low
+    inside = rng.uniform(low, high, (n, X.shape[1]))
+    outside = rng.uniform(low - 3 * span, high + 3 * span, (n, X.shape[1]))
+    extreme = np.array([[-1e9] * X.shape[1], [1e9] * X.shape[1], [0.0] * X.shape[1]])
+    split = forest.left != np.arange(len(forest.left))
+    thresholds = forest.threshold[split]
+    edges = rng.choice(np.concatenate([thresholds, np.nextafter(thresholds, np.inf),
+                                       np.nextafter(thresholds, -np.inf)]), (n, X.shape[1]))
+    # Put each threshold on its own feature so the boundary is actually tested
+    on_edge = inside.copy()
+    on_edge[np.arange(n), forest.feature[split][rng.integers(0, split.sum(), n)]] = edges[:, 0]
+    return np.vstack([inside, outside, extreme, on_edge])
+
+
+def reference_contributions(model, scaler, X, class_index):
+    """Tree-path decomposition computed from sklearn's own decision paths"""
+    X_scaled = scaler.transform(X)
+    out = np.zeros((len(X), 1 + X.shape[1]))
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :] / tree.value[:, 0, :].sum(axis=1, keepdims=True)
+        value = value[:, class_index]
+        out[:, 0] += value[0]
+        paths = estimator.decision_path(X_scaled)
+        for row in range(len(X)):
+            nodes = paths.indices[paths.indptr[row]:paths.indptr[row + 1]]
+            for parent, child in zip(nodes[:-1], nodes[1:]):
+                out[row, 1 + tree.feature[parent]] += value[child] - value[parent]
+    return out / len(model.estimators_)
+
+
+@pytest.mark.parametrize('n_classes, params', [
+    (2, {}),
+    (2, {'max_depth': 4}),
+    (3, {}),
+])
+def test_predict_proba_matches_sklearn(n_classes, params):
+    model, scaler, X = make_model(n_classes, **params)
+    forest = compile_forest(model, scaler, X)
+    assert forest.grid_proba is not None
+    points = sample_points(forest, X)
+    expected = model.predict_proba(scaler.transform(points))
+    np.testing.assert_allclose(forest.predict_proba(points), expected, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(forest._traverse_proba(points), expected, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(forest.predict(points), model.predict(scaler.transform(points)))
+
+
+def test_single_row_input():
+    model, scaler, X = make_model()
+    forest = compile_forest(model, scaler)
+    expected = model.predict_proba(scaler.transform(X[:1]))
+    np.testing.assert_allclose(forest.predict_proba(X[0].tolist()), expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_contributions_match_decision_paths(n_classes):
+    model, scaler, X = make_model(n_classes)
+    forest = compile_forest(model, scaler)
+    points = sample_points(forest, X, n=300)
+    for class_index in range(1, n_classes):
+        expected = reference_contributions(model, scaler, points, class_index)
+        actual = forest.contributions(points, class_index=class_index)
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-12)
+        # Base rate plus shares add up to the class probability
+        np.testing.assert_allclose(actual.sum(axis=1), forest.predict_proba(points)[:, class_index],
+                                   rtol=0, atol=1e-12)
+
+
+def test_traversal_without_grid_matches_sklearn(tmp_path):
+    model, scaler, X = make_model(3)
+    forest = compile_forest(model, scaler)
+    forest.save(str(tmp_path / 'forest'))
+    # An artifact saved without grid tables (or too large to tabulate) is scored by traversal
+    for name in ('grid_edges', 'grid_sizes', 'grid_proba', 'grid_contributions'):
+        (tmp_path / 'forest' / f'{name}.npy').unlink()
+    loaded = CompiledForest.load(str(tmp_path / 'forest'))
+    assert loaded.grid_proba is None
+    points = sample_points(forest, X, n=300)
+    np.testing.assert_allclose(loaded.predict_proba(points), model.predict_proba(scaler.transform(points)),
+                               rtol=0, atol=1e-12)
+    np.testing.assert_allclose(loaded.contributions(points), forest.contributions(points), rtol=0, atol=1e-12)
+
+
+def test_saved_forest_loads_memory_mapped(tmp_path):
+    model, scaler, X = make_model()
+    forest = compile_forest(model, scaler)
+    forest.save(str(tmp_path / 'forest'))
+    loaded = CompiledForest.load(str(tmp_path / 'forest'))
+    assert isinstance(loaded.grid_proba, np.memmap)
+    points = sample_points(forest, X, n=300)
+    np.testing.assert_array_equal(loaded.predict_proba(points), forest.predict_proba(points))
+    np.testing.assert_array_equal(loaded.contributions(points), forest.contributions(points))
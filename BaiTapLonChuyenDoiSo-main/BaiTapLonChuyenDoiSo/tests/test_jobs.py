@@ -0,0 +1,60 @@
+import os
+import time
+
+import jobs
+
+
+def slow_job(path, seconds, progress):
+    """Job body run in the pool: report progress, sleep, then remove its input like run_scoring_job"""
+    try:
+        progress(0, 1)
+        time.sleep(seconds)
+        progress(1, 1)
+        return 'result-' + os.path.basename(path)
+    finally:
+        os.remove(path)
+
+
+def submit(queue, tmp_path, name, seconds):
+    path = tmp_path / name
+    path.write_text('roster')
+    return queue.submit(slow_job, name, str(path), seconds, cleanup=lambda: os.path.exists(path) and os.remove(path))
+
+
+def wait_for(queue, job_id, status, timeout=60):
+    deadline = time.monotonic() + timeout
+    while queue.get(job_id)['status'] != status and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return queue.get(job_id)
+
+
+def test_job_runs_in_pool(tmp_path):
+    queue = jobs.JobQueue(jobs.InMemoryJobBackend(), max_processes=1)
+    job_id = submit(queue, tmp_path, 'a.xlsx', 0)
+    job = wait_for(queue, job_id, 'done')
+    assert job['result_id'] == 'result-a.xlsx'
+    assert job['progress']['percent'] == 100.0
+    assert not (tmp_path / 'a.xlsx').exists()
+    assert queue.shutdown(timeout=10) == 0
+
+
+def test_shutdown_waits_for_running_jobs(tmp_path):
+    queue = jobs.JobQueue(jobs.InMemoryJobBackend(), max_processes=1)
+    job_id = submit(queue, tmp_path, 'a.xlsx', 1)
+    wait_for(queue, job_id, 'running')
+    assert queue.shutdown(timeout=60) == 0
+    assert queue.get(job_id)['status'] == 'done'
+
+
+def test_shutdown_fails_unfinished_jobs(tmp_path):
+    queue = jobs.JobQueue(jobs.InMemoryJobBackend(), max_jobs=1, max_processes=1)
+    running = submit(queue, tmp_path, 'a.xlsx', 60)
+    queued = submit(queue, tmp_path, 'b.xlsx', 60)
+    wait_for(queue, running, 'running')
+    assert queue.shutdown(timeout=0.5) == 2
+    for job_id in (running, queued):
+        job = queue.get(job_id)
+        assert job['status'] == 'failed'
+        assert job['error'] == jobs.ABANDONED_ERROR
+    assert not (tmp_path / 'a.xlsx').exists()
+    assert not (tmp_path / 'b.xlsx').exists()
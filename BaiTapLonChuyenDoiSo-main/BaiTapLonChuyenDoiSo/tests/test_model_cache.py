@@ -0,0 +1,74 @@
+from importlib.metadata import PackageNotFoundError
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+import model_cache
+
+
+def make_data(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.uniform(0, 10, n), rng.integers(0, 10, n), rng.integers(0, 5, n)]).astype(float)
+    y = (X[:, 1] + X[:, 2] > X[:, 0]).astype(int)
+    return X, y
+
+
+class CountingTrainer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, X, y):
+        self.calls += 1
+        scaler = StandardScaler()
+        model = RandomForestClassifier(n_estimators=5, random_state=0).fit(scaler.fit_transform(X), y)
+        return model, scaler, {}
+
+
+def without_sklearn(name):
+    raise PackageNotFoundError(name)
+
+
+@pytest.fixture
+def artifact_dir(tmp_path):
+    return str(tmp_path / 'artifacts')
+
+
+def test_cached_artifact_is_reused(artifact_dir):
+    X, y = make_data()
+    train = CountingTrainer()
+    first, key = model_cache.load_or_train(X, y, {'n': 5}, train, artifact_dir)
+    again, same_key = model_cache.load_or_train(X, y, {'n': 5}, train, artifact_dir)
+    assert (key, train.calls) == (same_key, 1)
+    assert model_cache.load_meta(key, artifact_dir)['sklearn'] == model_cache.sklearn_version()
+    np.testing.assert_array_equal(again.predict_proba(X), first.predict_proba(X))
+
+
+def test_served_without_sklearn_installed(artifact_dir, monkeypatch):
+    X, y = make_data()
+    train = CountingTrainer()
+    _, key = model_cache.load_or_train(X, y, {'n': 5}, train, artifact_dir)
+    monkeypatch.setattr(model_cache, 'version', without_sklearn)
+    assert model_cache.sklearn_version() is None
+    forest, same_key = model_cache.load_or_train(X, y, {'n': 5}, train, artifact_dir)
+    assert (same_key, train.calls) == (key, 1)
+    assert forest.version == key
+
+
+def test_retrained_for_another_sklearn_version(artifact_dir, monkeypatch):
+    X, y = make_data()
+    train = CountingTrainer()
+    _, key = model_cache.load_or_train(X, y, {'n': 5}, train, artifact_dir)
+    monkeypatch.setattr(model_cache, 'version', lambda name: '0.0.1')
+    _, same_key = model_cache.load_or_train(X, y, {'n': 5}, train, artifact_dir)
+    assert (same_key, train.calls) == (key, 2)
+    assert model_cache.load_meta(key, artifact_dir)['sklearn'] == '0.0.1'
+
+
+def test_key_depends_on_data_and_params():
+    X, y = make_data()
+    key = model_cache.artifact_key(X, y, {'n': 5})
+    assert key == model_cache.artifact_key(X.copy(), y.copy(), {'n': 5})
+    assert key != model_cache.artifact_key(X, y, {'n': 6})
+    assert key != model_cache.artifact_key(X, 1 - y, {'n': 5})
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from prediction_cache import PredictionCache, normalize_features
+
+
+class Model:
+    """Fake compute_fn recording the rows it is asked to score"""
+
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.calls = []
+
+    def __call__(self, rows):
+        rows = np.asarray(rows)
+        self.calls.append(rows.copy())
+        # One output row per input row, distinct for every feature triple
+        return np.column_stack([rows.sum(axis=1) + self.offset, rows[:, 0] * 100 + rows[:, 1] * 10 + rows[:, 2]])
+
+
+def test_duplicates_scored_once_and_scattered_back():
+    cache = PredictionCache()
+    model = Model()
+    features = np.array([[7.5, 2, 1], [5.0, 0, 0], [7.5, 2, 1], [5.0, 0, 0], [7.5, 2, 1]])
+    result = cache.lookup(features, 'v1', model)
+    np.testing.assert_array_equal(result, model(features))
+    assert len(model.calls[0]) == 2
+    assert cache.stats()['dedup_ratio'] == 0.6
+
+
+def test_only_missing_rows_reach_the_model():
+    cache = PredictionCache()
+    model = Model()
+    cache.lookup([[7.5, 2, 1], [5.0, 0, 0]], 'v1', model)
+    result = cache.lookup([[5.0, 0, 0], [9.0, 1, 1], [7.5, 2, 1]], 'v1', model)
+    np.testing.assert_array_equal(model.calls[1], [[9.0, 1, 1]])
+    np.testing.assert_array_equal(result, model(np.array([[5.0, 0, 0], [9.0, 1, 1], [7.5, 2, 1]])))
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 3)
+
+
+def test_all_hits_skip_the_model():
+    cache = PredictionCache()
+    model = Model()
+    cache.lookup([[7.5, 2, 1]], 'v1', model)
+    cache.lookup([[7.5, 2, 1], [7.5, 2, 1]], 'v1', model)
+    assert len(model.calls) == 1
+
+
+def test_equal_ints_floats_and_signed_zero_share_a_key():
+    cache = PredictionCache()
+    model = Model()
+    cache.lookup([[7, 2, 0.0]], 'v1', model)
+    cache.lookup(np.array([[7.0, 2.0, -0.0]]), 'v1', model)
+    assert len(model.calls) == 1
+    assert normalize_features([7, 2, 1]).shape == (1, 3)
+
+
+def test_new_model_version_drops_the_cache():
+    cache = PredictionCache()
+    old, new = Model(), Model(offset=1000)
+    cache.lookup([[7.5, 2, 1]], 'v1', old)
+    result = cache.lookup([[7.5, 2, 1]], 'v2', new)
+    assert len(new.calls) == 1
+    assert result[0, 0] == 1010.5
+    assert cache.stats()['model_version'] == 'v2'
+    assert cache.stats()['entries'] == 1
+
+
+def test_lru_bound():
+    cache = PredictionCache(max_entries=3)
+    model = Model()
+    for i in range(3):
+        cache.lookup([[i, 0, 0]], 'v1', model)
+    # Touch row 0 so row 1 is the least recently used
+    cache.lookup([[0, 0, 0]], 'v1', model)
+    cache.lookup([[3, 0, 0], [4, 0, 0]], 'v1', model)
+    assert cache.stats()['entries'] == 3
+    calls = len(model.calls)
+    cache.lookup([[0, 0, 0], [3, 0, 0], [4, 0, 0]], 'v1', model)
+    assert len(model.calls) == calls
+    cache.lookup([[1, 0, 0]], 'v1', model)
+    assert len(model.calls) == calls + 1
+
+
+def test_empty_batch():
+    cache = PredictionCache()
+    result = cache.lookup(np.empty((0, 3)), 'v1', lambda rows: np.empty((0, 2)))
+    assert result.shape == (0, 2)
+
+
+@pytest.mark.parametrize('rows', [1, 50, 1000])
+def test_matches_uncached_output(rows):
+    rng = np.random.default_rng(rows)
+    features = np.column_stack([rng.choice([5.0, 6.5, 8.0], rows), rng.integers(0, 4, rows), rng.integers(0, 3, rows)])
+    cache = PredictionCache(max_entries=10)
+    model = Model()
+    for _ in range(2):
+        np.testing.assert_array_equal(cache.lookup(features, 'v1', model), Model()(features))
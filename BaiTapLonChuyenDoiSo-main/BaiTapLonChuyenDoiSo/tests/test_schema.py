@@ -0,0 +1,107 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingestion
+import schema
+
+
+@pytest.fixture(autouse=True)
+def clear_resolve_cache():
+    schema._resolve.cache_clear()
+    yield
+    schema._resolve.cache_clear()
+
+
+def test_normalize_header():
+    assert schema.normalize_header('  Điểm  TB ') == 'diemtb'
+    assert schema.normalize_header('diem_tb') == 'diemtb'
+    assert schema.normalize_header('Số tín chỉ rớt') == 'sotinchirot'
+
+
+def test_resolve_normalized_aliases():
+    columns = ['Mã sinh viên', 'ho ten', 'DIEM TB', 'Tín chỉ rớt', 'so_mon_hoc_lai']
+    assert schema.resolve_columns(columns) == {
+        'MaSV': 'Mã sinh viên',
+        'HoTen': 'ho ten',
+        'DiemTB': 'DIEM TB',
+        'TinChiRot': 'Tín chỉ rớt',
+        'SoMonHocLai': 'so_mon_hoc_lai'
+    }
+
+
+def test_resolve_prefers_earlier_alias_and_exact_header():
+    # 'MaSv' comes before 'MSSV' in the alias list
+    assert schema.resolve_columns(['MSSV', 'MaSv'], ('MaSV',)) == {'MaSV': 'MaSv'}
+    # 'diem_tb' only matches 'DiemTB' after normalizing; the exact header wins
+    assert schema.resolve_columns(['diem tb', 'DiemTB'], ('DiemTB',)) == {'DiemTB': 'DiemTB'}
+
+
+def test_resolve_missing_columns_are_left_out():
+    assert schema.resolve_columns(['DiemTB'], schema.FEATURES) == {'DiemTB': 'DiemTB'}
+
+
+def test_resolve_is_cached_per_header_signature():
+    columns = pd.Index(['MaSV', 'DiemTB', 'TinChiRot'])
+    first = schema.resolve_columns(columns)
+    second = schema.resolve_columns(list(columns))
+    info = schema._resolve.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert first == second
+
+    # Callers get a copy, so mutating it cannot poison the cache
+    first['Lop'] = 'Lop'
+    assert 'Lop' not in schema.resolve_columns(columns)
+
+
+def test_apply_defaults_continues_across_chunks():
+    df = pd.DataFrame({'DiemTB': [7.0, 8.0]})
+    actual_columns = schema.apply_defaults(df, {'DiemTB': 'DiemTB'}, offset=9)
+    assert list(df['MaSV']) == ['SV010', 'SV011']
+    assert list(df['HoTen']) == ['Sinh viên 10', 'Sinh viên 11']
+    assert list(df['SoMonHocLai']) == [0, 0]
+    assert actual_columns['Lop'] == 'Lop'
+
+
+def test_coerce_columns():
+    df = pd.DataFrame({
+        'MaSV': [' 00123 ', 456, 'SV7'],
+        'DiemTB': ['7.5', 'abc', None],
+        'TinChiRot': ['2', '', 3],
+        'SoMonHocLai': [1, 0, 'x']
+    })
+    actual_columns = {key: key for key in df.columns}
+    schema.coerce_columns(df, actual_columns)
+    assert list(df['MaSV']) == ['00123', '456', 'SV7']
+    np.testing.assert_array_equal(schema.features(df, actual_columns), [[7.5, 2, 1], [0, 0, 0], [0, 3, 0]])
+
+
+def _csv_upload():
+    return io.BytesIO('MaSV,DiemTB,TinChiRot,SoMonHocLai\n00123,7.5,2,1\n00456,5,0,0\n'.encode('utf-8'))
+
+
+def _xlsx_upload():
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    sheet = wb.active
+    sheet.append(['MaSV', 'DiemTB', 'TinChiRot', 'SoMonHocLai'])
+    sheet.append(['00123', 7.5, 2, 1])
+    sheet.append(['00456', 5, 0, 0])
+    file = io.BytesIO()
+    wb.save(file)
+    file.seek(0)
+    return file
+
+
+@pytest.mark.parametrize('filename, upload', [('sv.csv', _csv_upload), ('sv.xlsx', _xlsx_upload)])
+def test_csv_and_xlsx_read_the_same(filename, upload):
+    # The CSV reader reads text like openpyxl does, so IDs keep their leading zeros
+    chunks = list(ingestion.iter_chunks(upload(), filename))
+    assert len(chunks) == 1
+    actual_columns = schema.resolve_columns(chunks[0].columns)
+    df, actual_columns = ingestion.prepare_chunk(chunks[0], actual_columns, 0)
+    assert list(df[actual_columns['MaSV']]) == ['00123', '00456']
+    np.testing.assert_array_equal(schema.features(df, actual_columns), [[7.5, 2, 1], [5, 0, 0]])
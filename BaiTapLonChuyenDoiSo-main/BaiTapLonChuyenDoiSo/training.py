@@ -0,0 +1,226 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from forest_engine import compile_forest
+
+
+# Worker processes for the hyperparameter search (0 = one per core)
+DEFAULT_PROCESSES = int(os.environ.get('TRAIN_PROCESSES', 0)) or os.cpu_count() or 1
+
+
+def candidate_grid(search):
+    """Every combination of the searched values, e.g. {'n_estimators': [50, 100], 'max_depth': [None, 8]}"""
+    names = sorted(search)
+    return [dict(zip(names, values)) for values in itertools.product(*(search[name] for name in names))]
+
+
+def _auc(classes, y_true, proba):
+    """ROC AUC (one-vs-rest when there are more than two classes), or None if undefined"""
+    from sklearn.metrics import roc_auc_score
+
+    if len(np.unique(y_true)) < 2:
+        return None
+    if len(classes) == 2:
+        return float(roc_auc_score(y_true == classes[1], proba[:, 1]))
+    return float(roc_auc_score(y_true, proba, multi_class='ovr', labels=classes))
+
+
+def _cv_folds(y, cv):
+    """Largest usable fold count: every class needs at least one row per fold"""
+    _, counts = np.unique(y, return_counts=True)
+    return int(min(cv, counts.min()))
+
+
+def evaluate_candidate(candidate, X_train_scaled, y_train, X_test, y_test, scaler, cv=5, random_state=42):
+    """Runs in a pool process: cross-validate one candidate, then fit it and score the holdout.
+
+    Returns the report and the compiled forest (the latency is measured
+    afterwards in the parent, one candidate at a time, so it is not skewed
+    by the other searches running alongside).
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import StratifiedKFold, cross_val_score
+
+    report = dict(candidate)
+    start = time.perf_counter()
+
+    # One core per candidate: the pool already keeps every core busy
+    model = RandomForestClassifier(random_state=random_state, n_jobs=1, **candidate)
+    folds = _cv_folds(y_train, cv)
+    if folds >= 2:
+        scoring = 'roc_auc' if len(np.unique(y_train)) == 2 else 'accuracy'
+        scores = cross_val_score(model, X_train_scaled, y_train, scoring=scoring,
+                                 cv=StratifiedKFold(folds, shuffle=True, random_state=random_state))
+        report.update(cv_metric=scoring, cv_score=float(scores.mean()), cv_std=float(scores.std()))
+    else:
+        report.update(cv_metric=None, cv_score=None, cv_std=None)
+
+    model.fit(X_train_scaled, y_train)
+    proba = model.predict_proba(scaler.transform(X_test))
+    report['holdout_accuracy'] = float(np.mean(model.classes_[proba.argmax(axis=1)] == y_test))
+    report['holdout_auc'] = _auc(model.classes_, y_test, proba)
+    report['fit_seconds'] = round(time.perf_counter() - start, 3)
+    return report, compile_forest(model, scaler, X_test)
+
+
+def measure_latency(forest, X, repeats=200):
+    """(ms per single-row prediction, µs per row in a batch) for a compiled forest"""
+    X = np.asarray(X, dtype=np.float64)
+    rows = X[np.arange(repeats) % len(X)]
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        forest.predict_proba(row)
+        timings.append(time.perf_counter() - start)
+    batch = np.tile(X, (max(1, 10000 // len(X)), 1))
+    start = time.perf_counter()
+    forest.predict_proba(batch)
+    batch_seconds = time.perf_counter() - start
+    return float(np.median(timings) * 1000), float(batch_seconds / len(batch) * 1e6)
+
+
+def search(X_train_scaled, y_train, X_test, y_test, scaler, grid, cv=5, random_state=42,
+           processes=DEFAULT_PROCESSES):
+    """Evaluate every candidate (in a process pool when there is more than one) and measure its latency"""
+    candidates = candidate_grid(grid)
+    args = (X_train_scaled, y_train, X_test, y_test, scaler, cv, random_state)
+    if len(candidates) == 1 or processes <= 1:
+        results = [evaluate_candidate(candidate, *args) for candidate in candidates]
+    else:
+        # 'spawn' so the workers never inherit the web server's threads
+        with ProcessPoolExecutor(max_workers=min(processes, len(candidates)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(evaluate_candidate, candidate, *args) for candidate in candidates]
+            results = [future.result() for future in futures]
+
+    reports = []
+    for report, forest in results:
+        report['latency_ms'], report['batch_latency_us'] = measure_latency(forest, X_test)
+        reports.append(report)
+    return reports
+
+
+def select_candidate(reports, latency_budget_ms):
+    """Best CV score (holdout AUC, then accuracy as tie-breakers) among candidates within the latency budget.
+
+    Falls back to the fastest candidate when none fits the budget.
+    """
+    within = [r for r in reports if r['latency_ms'] <= latency_budget_ms]
+    if not within:
+        print(f"No candidate within the {latency_budget_ms} ms latency budget, using the fastest one")
+        return min(reports, key=lambda r: r['latency_ms'])
+    return max(within, key=lambda r: (
+        r['cv_score'] if r['cv_score'] is not None else -np.inf,
+        r['holdout_auc'] if r['holdout_auc'] is not None else -np.inf,
+        r['holdout_accuracy'],
+        -r['latency_ms']
+    ))
+
+
+def _fmt(value, spec):
+    return 'n/a' if value is None else format(value, spec)
+
+
+def format_report(reports, selected=None):
+    """Plain-text table of the search results"""
+    lines = ['n_estimators  max_depth  cv_score  holdout_acc  holdout_auc  latency_ms  batch_us/row']
+    for r in reports:
+        lines.append('%12s  %9s  %8s  %11s  %11s  %10s  %12s%s' % (
+            r['n_estimators'], r['max_depth'], _fmt(r['cv_score'], '.4f'), _fmt(r['holdout_accuracy'], '.4f'),
+            _fmt(r['holdout_auc'], '.4f'), _fmt(r['latency_ms'], '.3f'), _fmt(r['batch_latency_us'], '.2f'),
+            '  <- selected' if r is selected else ''))
+    return '\n'.join(lines)
+
+
+def train_and_select(X, y, params, processes=DEFAULT_PROCESSES):
+    """Split, scale, search params['search'] and refit the chosen forest on all cores.
+
+    Returns (model, scaler, report); the report lists every candidate and the
+    one selected under params['latency_budget_ms'].
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=params['test_size'], random_state=params['random_state'])
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+
+    reports = search(X_train_scaled, y_train, X_test, y_test, scaler, params['search'],
+                     cv=params['cv_folds'], random_state=params['random_state'], processes=processes)
+    selected = select_candidate(reports, params['latency_budget_ms'])
+    print(format_report(reports, selected))
+
+    hyperparameters = {name: selected[name] for name in params['search']}
+    model = RandomForestClassifier(random_state=params['random_state'], n_jobs=-1, **hyperparameters)
+    model.fit(X_train_scaled, y_train)
+    # Serving is single-row or already parallel; keep predict_proba off the thread pool
+    model.set_params(n_jobs=None)
+
+    return model, scaler, {'selected': hyperparameters, 'candidates': reports,
+                           'latency_budget_ms': params['latency_budget_ms']}
+
+
+RETRAIN_MODES = ('warm_start', 'new')
+
+
+def _batch_metrics(model, scaler, X, y):
+    proba = model.predict_proba(scaler.transform(X))
+    return {'accuracy': float(np.mean(model.classes_[proba.argmax(axis=1)] == y)),
+            'auc': _auc(model.classes_, y, proba)}
+
+
+def check_retrain_params(mode, new_trees):
+    """Raise ValueError for an unknown mode or a warm start that would add no trees"""
+    if mode not in RETRAIN_MODES:
+        raise ValueError(f'Chế độ huấn luyện không hợp lệ: {mode}')
+    if new_trees < 1:
+        raise ValueError('Số cây bổ sung (trees) phải lớn hơn 0')
+
+
+def check_retrain_batch(classes, y_new, mode):
+    """Raise ValueError if a labeled batch cannot update a forest with these classes in this mode"""
+    if mode not in RETRAIN_MODES:
+        raise ValueError(f'Chế độ huấn luyện không hợp lệ: {mode}')
+    # Trees only ever add probability columns for the classes they saw
+    if mode == 'warm_start' and not np.array_equal(np.unique(y_new), classes):
+        raise ValueError('Dữ liệu mới phải có đủ các nhãn BoHoc %s để bổ sung cây' % np.asarray(classes).tolist())
+
+
+def retrain(model, scaler, X_new, y_new, mode='warm_start', new_trees=20, random_state=42):
+    """Update a fitted forest with a new labeled batch; returns (model, scaler, report).
+
+    'warm_start' keeps every existing tree (and the scaler) and grows the
+    forest by new_trees trees fitted on the new rows only. 'new' trains a
+    fresh scaler and forest, with the parent's hyperparameters, on the new
+    rows only. The report scores the parent on the new batch, which it has
+    never seen: a rough measure of how much the cohort has drifted.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    X_new = np.asarray(X_new, dtype=np.float64)
+    y_new = np.asarray(y_new)
+    check_retrain_batch(model.classes_, y_new, mode)
+    report = {'mode': mode, 'rows': int(len(y_new)), 'parent_on_batch': _batch_metrics(model, scaler, X_new, y_new)}
+
+    if mode == 'warm_start':
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + new_trees, n_jobs=-1)
+        model.fit(scaler.transform(X_new), y_new)
+        model.set_params(warm_start=False, n_jobs=None)
+    elif mode == 'new':
+        scaler = StandardScaler()
+        model = RandomForestClassifier(n_estimators=model.n_estimators, max_depth=model.max_depth,
+                                       random_state=random_state, n_jobs=-1)
+        model.fit(scaler.fit_transform(X_new), y_new)
+        model.set_params(n_jobs=None)
+
+    report['n_estimators'] = len(model.estimators_)
+    return model, scaler, report
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: serve.py runs a single process there, the in-process lock is enough
+    fcntl = None
+
+import numpy as np
+
+# Feature order of every stored row (same as the model input)
+from schema import FEATURES
+
+
+DEFAULT_STORE_DIR = os.environ.get('TRAINING_STORE_DIR', 'training_store')
+
+
+def prepare_batch(X, y):
+    """(X, y) as the float64 / int64 arrays the store writes; ValueError if they cannot be stored"""
+    X = np.ascontiguousarray(X, dtype='<f8').reshape(-1, len(FEATURES))
+    try:
+        y = np.ascontiguousarray(y, dtype='<i8')
+    except (TypeError, ValueError):
+        raise ValueError('Cột BoHoc phải là số (0 hoặc 1)')
+    if len(X) != len(y):
+        raise ValueError('Số dòng đặc trưng và nhãn không khớp')
+    if len(X) == 0:
+        raise ValueError('Không có dòng dữ liệu có nhãn nào')
+    return X, y
+
+
+class TrainingStore:
+    """Append-only columnar store of labeled training rows.
+
+    Features and labels are raw little-endian binary files (``X.f64`` with
+    one float64 row per student, ``y.i64`` with the BoHoc labels) read back
+    through np.memmap, so appending a semester never rewrites earlier ones.
+    ``store.json`` holds the committed row count and one entry per appended
+    batch; it is replaced atomically after the data is fsynced, so a crash
+    mid-append leaves only trailing bytes that the next append truncates.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._x_file = os.path.join(path, 'X.f64')
+        self._y_file = os.path.join(path, 'y.i64')
+        self._meta_file = os.path.join(path, 'store.json')
+        self._lock_file = None
+
+    def meta(self):
+        if not os.path.exists(self._meta_file):
+            return {'features': list(FEATURES), 'rows': 0, 'batches': []}
+        with open(self._meta_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    def __len__(self):
+        return self.meta()['rows']
+
+    def _write_meta(self, meta):
+        tmp_file = self._meta_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self._meta_file)
+
+    def append(self, X, y, source=None):
+        """Append labeled rows; returns the batch record (with its start row)"""
+        X, y = prepare_batch(X, y)
+
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            meta = self.meta()
+            rows = meta['rows']
+            for name, values in ((self._x_file, X), (self._y_file, y)):
+                with open(name, 'ab') as f:
+                    # Drop bytes left by an append that never committed
+                    f.truncate(rows * (values.nbytes // len(values)))
+                    f.write(values.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            batch = {'start': rows, 'rows': len(X), 'source': source, 'added_at': time.time()}
+            meta['rows'] = rows + len(X)
+            meta['batches'].append(batch)
+            self._write_meta(meta)
+        return batch
+
+    def try_lock(self):
+        """Take the store's lock file without blocking; False if another process holds it.
+
+        Keeps serve.py workers from appending or retraining at the same time.
+        """
+        if fcntl is None:
+            return True
+        os.makedirs(self.path, exist_ok=True)
+        lock_file = open(os.path.join(self.path, '.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def unlock(self):
+        if self._lock_file is not None:
+            # Closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def load(self, start=0, stop=None):
+        """(X, y) memory-mapped views of rows [start, stop)"""
+        rows = len(self)
+        stop = rows if stop is None else min(stop, rows)
+        if rows == 0 or start >= stop:
+            return np.empty((0, len(FEATURES))), np.empty(0, dtype=np.int64)
+        X = np.memmap(self._x_file, dtype='<f8', mode='r', shape=(rows, len(FEATURES)))
+        y = np.memmap(self._y_file, dtype='<i8', mode='r', shape=(rows,))
+        return X[start:stop], y[start:stop]
+
+    def batch(self, index=-1):
+        """(X, y, record) of one appended batch, by default the latest"""
+        record = self.meta()['batches'][index]
+        X, y = self.load(record['start'], record['start'] + record['rows'])
+        return X, y, record